@@ -1,110 +1,162 @@
 import streamlit as st
-import xarray as xr
 import numpy as np
 import pandas as pd
 import pydeck as pdk
-import matplotlib as mpl
-import matplotlib.pyplot as plt
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import era5_data
+import export
+import manifest
+import memory_report
+import metrics
+import quantize
+import shared_cache
+from era5_data import DATA_DIR, edges_from_centers, file_for_mode
+
 # ✅ 用于 deck.gl click 事件回传
 from streamlit_deckgl import st_deckgl
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 st.set_page_config(page_title="🌍 Interactive Map for Global Warming", layout="wide")
 
 # Map_Interactive.py 所在目录
 APP_DIR = Path(__file__).resolve().parent
 
-# ERA5 数据目录（与 Map_Interactive.py 同级）
-DATA_DIR = APP_DIR / "ERA5_monthly"
-
-# 检查数据目录是否存在
+# 检查数据目录是否存在（DATA_DIR 见 era5_data.py，可用 GW_DATA_DIR 覆盖）
 if not DATA_DIR.exists():
     st.error(f"找不到 ERA5 数据文件夹：{DATA_DIR}")
     st.stop()
 
-MONTH_FILE_TMPL = "t2m_2deg_month_{:02d}.nc"
-ANNUAL_FILE = "t2m_2deg_annual_mean.nc"
-
 # 带国界/海岸线的底图（无需 token）
 BASEMAP = "https://basemaps.cartocdn.com/gl/positron-gl-style/style.json"
 
+# 本地瓦片服务地址（见 tile_server.py）；设置后可切换成只加载可见瓦片的 TileLayer
+TILE_URL = os.environ.get("GW_TILE_URL", "").rstrip("/")
 
-def k_to_c(k):
-    return k - 273.15
-
+# 调试面板：URL 加 ?debug=1 或设置环境变量 GW_DEBUG=1
+DEBUG = st.query_params.get("debug") == "1" or os.environ.get("GW_DEBUG") == "1"
 
-def draw_colorbar(vmin, vmax, cmap_name="turbo"):
-    fig, ax = plt.subplots(figsize=(7.2, 0.55), dpi=160)
-    fig.subplots_adjust(bottom=0.45)
-    cmap = mpl.colormaps.get_cmap(cmap_name)
-    norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax)
-    cb = mpl.colorbar.ColorbarBase(ax, cmap=cmap, norm=norm, orientation="horizontal")
-    cb.set_label("Temperature (°C)")
-    return fig
+# 每次 rerun 的阶段计时（每次一行 JSON 日志，见 GW_LOG_LEVEL）；GW_METRICS_PORT 设置时每个进程起一个 /metrics 端点
+metrics.configure_logging()
+trace = metrics.RerunTrace()
+metrics.start_exporter()
+memory_report.start_periodic_log()
+memory_report.register_source("shared_cache (host-wide, mmap)", shared_cache.STORE.stats)
+memory_report.register_source("open NetCDF handles", era5_data.POOL.stats)
 
 
-def file_for_mode(mode):
-    # mode: "Annual" 或 1..12
-    if mode == "Annual":
-        return DATA_DIR / ANNUAL_FILE
-    else:
-        return DATA_DIR / MONTH_FILE_TMPL.format(int(mode))
+class CompactDeck(pdk.Deck):
+    """
+    pydeck 默认用 indent=2 序列化整个 deck（st_deckgl 调的就是 to_json），
+    一半以上的 payload 是空白；这里改成紧凑 JSON，其余行为不变。
+    """
 
+    def to_json(self):
+        from pydeck.bindings.json_tools import default_serialize
 
-@st.cache_data(show_spinner=False)
-def get_years_for_file(path):
-    ds = xr.open_dataset(path)
-    years = np.unique(pd.to_datetime(ds["valid_time"].values).year)
-    ds.close()
-    return years
+        return json.dumps(self, sort_keys=True, default=default_serialize, separators=(",", ":"))
 
 
-@st.cache_data(show_spinner=True)
-def load_year_field(mode, year):
+def deferred_export(export_fn, *args):
     """
-    读取某个月(1-12)或 Annual 的某一年气温场
-    输出：lat(1d), lon(1d, -180..180 已排序), temp_c(2d: lat x lon)
+    download_button 的 data=callable：点击时才读数据、生成文件，平时 rerun 不做任何导出工作。
+    Streamlit 会把结果整个放进内存再发给浏览器，大范围的 cube 导出请走瓦片服务的 /export（分块发送）。
     """
-    path = file_for_mode(mode)
-    ds = xr.open_dataset(path)
 
-    time_index = pd.to_datetime(ds["valid_time"].values)
-    mask = (time_index.year == int(year))
+    def generate():
+        _, _, chunks = export_fn(*args)
+        return b"".join(chunks)
+
+    return generate
 
-    if mask.sum() == 0:
-        ds.close()
-        raise ValueError(f"No data for year={year} in {path.name}")
 
-    # 取该年的时间点（保险起见：若不止一个就平均）
-    t2m = ds["t2m"].sel(valid_time=ds["valid_time"].values[mask]).mean("valid_time")
+@st.cache_resource(show_spinner=False)
+def background_pool():
+    """rerun 内并行阶段用的线程池（整个进程共用）。"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="gw-rerun")
 
-    # 经度 0..360 -> -180..180，并排序（防止日界线断裂）
-    lon = t2m["longitude"]
-    lon_fixed = (((lon + 180) % 360) - 180)
-    t2m = t2m.assign_coords(longitude=lon_fixed).sortby("longitude")
 
-    lat = t2m["latitude"].values
-    lon_sorted = t2m["longitude"].values
-    temp_c = k_to_c(t2m.values).astype(np.float32)
+def run_in_background(fn, *args):
+    """
+    在线程池里执行 fn(*args)，返回 Future。
+    带上当前 session 的 ScriptRunContext，st.cache_* 在线程里照常命中；
+    线程里不要调用会输出元素的 st.* 函数（spinner 也不行），结果回到主线程再渲染。
+    """
+    ctx = get_script_run_ctx()
 
-    ds.close()
-    return lat, lon_sorted, temp_c
+    def task():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
 
+    return background_pool().submit(task)
 
-def edges_from_centers(arr):
+
+@st.cache_data(show_spinner=False)
+def get_pyramid_levels(base_res, stamp=None):
+    """[(level, res_deg), ...]；没有金字塔时只有原始层。stamp（levels.json 的 mtime）变了就重新读。"""
+    metrics.mark_miss()
+    levels = era5_data.read_pyramid_levels(DATA_DIR)
+    if levels == [(0, None)]:
+        levels = [(0, base_res)]
+    return levels
+
+
+def _read_only(arrays):
+    # cache_resource 返回的是同一个对象，所有 session 共用，禁止原地修改
+    # （没有共享缓存、或写入失败退回原始数组时，这里拿到的就是 compute() 的结果）
+    for arr in arrays.values():
+        if isinstance(arr, np.ndarray) and not isinstance(arr, np.memmap):
+            arr.flags.writeable = False
+    return arrays
+
+
+# 解码结果放在本机共享目录（shared_cache.STORE），各 worker 进程只读映射同一份；
+# 这里用 cache_resource 只保存映射对象本身，不像 cache_data 那样 pickle 复制一份。
+# 映射着的条目即使被 shared_cache 淘汰，页面也要等这里的缓存放手才归还（见 shared_cache 的说明）。
+@st.cache_resource(show_spinner=True, max_entries=512)
+def load_year_field_stored(mode, year, level=0, version=None):
+    """
+    缓存里的一帧（只读）：
+    量化时 {"lat", "lon", "temp_q"(int16), "scale", "offset"}，否则 {"lat", "lon", "temp_c"(float32)}
+    version：manifest.frame_version；ingest.py 追加 / 修订某一年时只有这一帧换 key
+    """
+    metrics.mark_miss()
+    path = file_for_mode(mode, level)
+    if version is None:
+        version = shared_cache.source_token(path)
+    key = f"field:{manifest.mode_key(mode)}:L{level}:{int(year)}:{version}" + (":q16" if quantize.ENABLED else "")
+
+    def compute():
+        lat, lon, temp_c = era5_data.read_year_field(path, year)
+        if quantize.ENABLED:
+            return {
+                "lat": lat,
+                "lon": lon,
+                "temp_q": quantize.quantize(temp_c),
+                "scale": np.asarray(quantize.SCALE, dtype=np.float64),
+                "offset": np.asarray(quantize.OFFSET, dtype=np.float64),
+            }
+        return {"lat": lat, "lon": lon, "temp_c": temp_c}
+
+    return _read_only(shared_cache.STORE.get_or_compute(key, compute))
+
+
+def load_year_field(mode, year, level=0, version=None):
     """
-    给定中心点坐标（等间距），返回边界坐标。
-    例：centers=[...], edges 长度 = len(centers)+1
+    读取某个月(1-12)或 Annual 的某一年气温场（level>0 读金字塔粗化层）
+    输出：lat(1d), lon(1d, -180..180 已排序), temp_c(2d: lat x lon)
+    量化存储时在这里还原成 float32（只在本次 rerun 里用，不常驻内存）
     """
-    arr = np.asarray(arr, dtype=np.float64)
-    d = np.diff(arr)
-    step = np.median(np.abs(d)) if len(d) else 1.0
-    edges = np.empty(len(arr) + 1, dtype=np.float64)
-    edges[1:-1] = (arr[:-1] + arr[1:]) / 2.0
-    edges[0] = arr[0] - step / 2.0
-    edges[-1] = arr[-1] + step / 2.0
-    return edges
+    arrays = load_year_field_stored(mode, year, level, version)
+    if "temp_q" in arrays:
+        temp_c = quantize.dequantize(arrays["temp_q"], float(arrays["scale"]), float(arrays["offset"]))
+    else:
+        temp_c = arrays["temp_c"]
+    return arrays["lat"], arrays["lon"], temp_c
 
 
 @st.cache_data(show_spinner=True)
@@ -113,34 +165,29 @@ def grid_to_polygons(lat, lon, temp_c, cmap_name="turbo"):
     把 2D 栅格转成 PolygonLayer 需要的 DataFrame
     每格一个矩形 polygon，带 fill_color
     """
+    metrics.mark_miss()
     lat_edges = edges_from_centers(lat)
     lon_edges = edges_from_centers(lon)
 
-    vals = temp_c.ravel()
-    vals = vals[np.isfinite(vals)]
-    vmin = float(np.nanpercentile(vals, 2))
-    vmax = float(np.nanpercentile(vals, 98))
-    if vmax <= vmin:
-        vmax = vmin + 1.0
-
-    cmap = mpl.colormaps.get_cmap(cmap_name)
-    norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax)
+    vmin, vmax = era5_data.color_limits(temp_c)
+    # 整帧一次性上色（与 tile_server 同一个函数），不再逐格调用 colormap
+    rgb = era5_data.colorize(temp_c, vmin, vmax, cmap_name)
 
     records = []
     nlat = len(lat)
     nlon = len(lon)
 
+    # 发给地图的坐标/数值按 quantize 的精度取整，JSON payload 明显变小
     for i in range(nlat):
-        lat0, lat1 = float(lat_edges[i]), float(lat_edges[i + 1])
+        lat0, lat1 = quantize.round_coord(lat_edges[i]), quantize.round_coord(lat_edges[i + 1])
         for j in range(nlon):
             val = float(temp_c[i, j])
             if not np.isfinite(val):
                 continue
 
-            lon0, lon1 = float(lon_edges[j]), float(lon_edges[j + 1])
+            lon0, lon1 = quantize.round_coord(lon_edges[j]), quantize.round_coord(lon_edges[j + 1])
 
-            rgba = cmap(norm(val))
-            r, g, b = (np.array(rgba[:3]) * 255).astype(int).tolist()
+            r, g, b = rgb[i, j].tolist()
 
             poly = [
                 [lon0, lat0],
@@ -150,54 +197,51 @@ def grid_to_polygons(lat, lon, temp_c, cmap_name="turbo"):
             ]
 
             records.append(
-                {"polygon": poly, "temp_c": val, "fill_color": [r, g, b, 190]}
+                {"polygon": poly, "temp_c": quantize.round_value(val), "fill_color": [r, g, b, 190]}
             )
 
     df_poly = pd.DataFrame.from_records(records)
     return df_poly, vmin, vmax
 
 
-@st.cache_data(show_spinner=True)
-def load_point_timeseries(mode, lat0, lon0):
+@st.cache_resource(show_spinner=False)
+def load_coords(path):
+    metrics.mark_miss()
+    return era5_data.read_coords(path)
+
+
+# 在线程池里调用：不能显示 spinner
+@st.cache_resource(show_spinner=False, max_entries=512)
+def load_point_timeseries(mode, lat0, lon0, version=None):
     """
-    mode: "Annual" 或 1..12
+    mode: "Annual" 或 1..12；version：manifest.series_version，只有这个 mode 的数据变了才重新读
     返回：years(1d), temps_c(1d), nearest_lat, nearest_lon
+    共享缓存按最近邻格点 (i, j) 存，点到同一格子的点击共用一份
     """
+    metrics.mark_miss()
     path = file_for_mode(mode)
-    ds = xr.open_dataset(path)
-
-    time_index = pd.to_datetime(ds["valid_time"].values)
-    years_all = time_index.year
-
-    t2m = ds["t2m"]
-
-    # 经度修正到 [-180, 180)
-    lon = t2m["longitude"]
-    lon_fixed = (((lon + 180) % 360) - 180)
-    t2m = t2m.assign_coords(longitude=lon_fixed).sortby("longitude")
-
-    # 点击经度也规范化到 [-180, 180)
-    lon0_fixed = ((float(lon0) + 180) % 360) - 180
-
-    # 选最近邻格点
-    point = t2m.sel(latitude=float(lat0), longitude=float(lon0_fixed), method="nearest")
+    lat, lon = load_coords(path)
+    i, j = era5_data.nearest_index(lat, lon, lat0, lon0)
+    if version is None:
+        version = shared_cache.source_token(path)
+    key = f"point:{manifest.mode_key(mode)}:{version}:{i}:{j}"
 
-    # 保险起见按年聚合（即使一年有多时刻也能处理）
-    df = pd.DataFrame({"year": years_all, "t2m": point.values})
-    series = df.groupby("year")["t2m"].mean()
+    def compute():
+        years, temps_c = era5_data.read_point_series(path, i, j)
+        return {"years": years, "temps_c": temps_c}
 
-    years = series.index.values.astype(int)
-    temps_c = (series.values - 273.15).astype(np.float32)
-
-    nearest_lat = float(point["latitude"].values)
-    nearest_lon = float(point["longitude"].values)
-
-    ds.close()
-    return years, temps_c, nearest_lat, nearest_lon
+    arrays = _read_only(shared_cache.STORE.get_or_compute(key, compute))
+    return arrays["years"], arrays["temps_c"], float(lat[i]), float(era5_data.wrap_lon(lon[j]))
 
 
+# 图都用 matplotlib.figure.Figure 直接创建（不经过 pyplot 的全局状态），可以在线程池里画；
+# 也不会在 pyplot 里留下需要 plt.close 的 figure。colorbar 见 era5_data.draw_colorbar。
+# matplotlib 只在画图 / 上色的函数里 import，首次导入可以和主线程的数据准备重叠
 def plot_timeseries(years, temps_c, mode, nearest_lat, nearest_lon):
-    fig, ax = plt.subplots(figsize=(8.2, 3.6), dpi=160)
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8.2, 3.6), dpi=160)
+    ax = fig.subplots()
     ax.plot(years, temps_c)
 
     if mode == "Annual":
@@ -212,6 +256,27 @@ def plot_timeseries(years, temps_c, mode, nearest_lat, nearest_lon):
     return fig
 
 
+def point_series_figure(mode, lat0, lon0, version=None):
+    """
+    点击位置的时间序列 + 曲线图（不依赖地图，可以和气温场解码并行）。
+    返回 years, temps, nearest_lat, nearest_lon, fig（没有 1940–2024 的数据时 fig 为 None）
+    """
+    with trace.stage("load_point_timeseries", cached=True) as rec:
+        years_ts, temps_ts, near_lat, near_lon = load_point_timeseries(mode, lat0, lon0, version)
+        rec["bytes"] = int(years_ts.nbytes + temps_ts.nbytes)
+
+    # 目标范围：1940–2024（若文件不全，会自动按可用年份截取）
+    mask = (years_ts >= 1940) & (years_ts <= 2024)
+    years_ts = years_ts[mask]
+    temps_ts = temps_ts[mask]
+
+    fig = None
+    if len(years_ts):
+        with trace.stage("plot_timeseries"):
+            fig = plot_timeseries(years_ts, temps_ts, mode, near_lat, near_lon)
+    return years_ts, temps_ts, near_lat, near_lon, fig
+
+
 def parse_click_latlon(event_dict):
     """
     尽量兼容不同 deck.gl 事件 payload 格式。
@@ -246,17 +311,19 @@ def parse_click_latlon(event_dict):
 # ----------------------------
 st.title("🌍 Interactive Map for Global Warming")
 
-# 文件存在性检查
-missing = []
-for m in range(1, 13):
-    if not (DATA_DIR / MONTH_FILE_TMPL.format(m)).exists():
-        missing.append(MONTH_FILE_TMPL.format(m))
-if not (DATA_DIR / ANNUAL_FILE).exists():
-    missing.append(ANNUAL_FILE)
+# 数据清单（manifest.json）：文件是否齐全、各 mode 年份范围都从这里读；
+# 数据文件有变化时会自动重建（见 manifest.py）
+with trace.stage("manifest"):
+    data_manifest = manifest.load_or_rebuild(DATA_DIR)
 
-if missing:
+if data_manifest["missing"]:
     st.warning("以下文件不存在（请确认文件名与目录）：")
-    st.code("\n".join(missing))
+    st.code("\n".join(data_manifest["missing"]))
+    st.stop()
+
+if data_manifest["errors"]:
+    st.error("数据文件校验失败（可运行 `python manifest.py` 查看详情）：")
+    st.code("\n".join(data_manifest["errors"]))
     st.stop()
 
 col_left, col_right = st.columns([1, 3])
@@ -272,8 +339,9 @@ with col_left:
     )
     mode = "Annual" if mode_label == "Annual" else int(mode_label)
 
-    years = get_years_for_file(file_for_mode(mode))
-    year_min, year_max = int(years.min()), int(years.max())
+    year_min, year_max = manifest.years_for_mode(data_manifest, mode)
+    # 点击曲线的缓存版本：只有这个 mode 的文件被 ingest.py 改过才重新读
+    series_version = manifest.series_version(data_manifest, mode)
     year = st.slider(
         "Select a year",
         min_value=year_min,
@@ -286,6 +354,8 @@ with col_left:
     cmap_name = st.selectbox("Color", ["turbo", "viridis", "plasma", "inferno"], index=0)
     opacity = st.slider("Opacity", 0.2, 1.0, 0.85, 0.05)
     show_edges = st.toggle("Show Grid", value=False)
+    use_tiles = bool(TILE_URL) and st.toggle("Tiled layer", value=True, help="只从本地瓦片服务加载屏幕上可见的格子")
+    zoom = st.slider("Zoom", 1.0, 6.0, 1.0, 0.5, help="放大时以最近一次点击的位置为中心，并自动换用更细的网格层级")
 
     st.caption(f"数据目录：{DATA_DIR}")
 
@@ -294,8 +364,46 @@ with col_left:
     st.caption("直接在右侧主地图上点击一个格子：\n- Month 模式：画该月逐年曲线\n- Annual 模式：画年平均逐年曲线")
 
 with col_right:
-    lat, lon, temp_c = load_year_field(mode, year)
-    df_poly, vmin, vmax = grid_to_polygons(lat, lon, temp_c, cmap_name=cmap_name)
+    # 视图中心：放大时跟随最近一次点击，否则看全球
+    if zoom > 1.0 and "clicked_lat" in st.session_state:
+        center_lat, center_lon = float(st.session_state["clicked_lat"]), float(st.session_state["clicked_lon"])
+    else:
+        center_lat, center_lon = 20.0, 0.0
+    bounds = era5_data.view_bounds(center_lat, center_lon, zoom)
+
+    # 已经选过点时（比如只是拖了年份滑块），时间序列和地图互不依赖：
+    # 先交给线程池去读、去画，和下面的气温场解码 / 多边形构建重叠，渲染前再汇合
+    point_job = None
+    if "clicked_lat" in st.session_state:
+        point_args = (mode, float(st.session_state["clicked_lat"]), float(st.session_state["clicked_lon"]), series_version)
+        point_job = run_in_background(point_series_figure, *point_args)
+
+    # 按缩放级别选金字塔层：视图内格子数不超过 era5_data.MAX_CELLS
+    with trace.stage("get_pyramid_levels", cached=True):
+        levels = get_pyramid_levels(
+            data_manifest["files"][manifest.mode_key(mode)]["grid"]["res_deg"], era5_data.pyramid_stamp(DATA_DIR)
+        )
+    level = era5_data.choose_level(levels, bounds, zoom=zoom, mode=mode, data_dir=DATA_DIR)
+
+    with trace.stage("load_year_field", cached=True) as rec:
+        version = manifest.frame_version(data_manifest, mode, year, level)
+        lat, lon, temp_c = load_year_field(mode, year, level, version)
+        stored = load_year_field_stored(mode, year, level, version)
+        rec["bytes"] = int(sum(a.nbytes for a in stored.values()))
+
+    if use_tiles:
+        # 瓦片服务按整帧算色标，这里用同一帧算 colorbar；格子由浏览器按需取
+        vmin, vmax = era5_data.color_limits(temp_c)
+        slice_values = temp_c[np.isfinite(temp_c)]
+    else:
+        lat, lon, temp_c = era5_data.crop_to_view(lat, lon, temp_c, bounds)
+        with trace.stage("grid_to_polygons", cached=True) as rec:
+            df_poly, vmin, vmax = grid_to_polygons(lat, lon, temp_c, cmap_name=cmap_name)
+            rec["bytes"] = int(df_poly.memory_usage(index=False).sum())
+        slice_values = df_poly["temp_c"]
+
+    # colorbar 只依赖色标范围：和下面 deck 的构建 / 序列化并行
+    colorbar_job = run_in_background(era5_data.draw_colorbar, vmin, vmax, cmap_name)
 
     if mode == "Annual":
         title = f"{year} — Annual Mean Temperature"
@@ -304,42 +412,72 @@ with col_right:
 
     st.subheader(title)
 
-    poly_layer = pdk.Layer(
-        "PolygonLayer",
-        data=df_poly,
-        get_polygon="polygon",
-        pickable=True,
-        filled=True,
-        stroked=bool(show_edges),
-        get_fill_color="fill_color",
-        get_line_color=[0, 0, 0, 60],
-        line_width_min_pixels=0.5,
-        opacity=float(opacity),
-    )
-
-    view_state = pdk.ViewState(latitude=20, longitude=0, zoom=1.0, pitch=0)
+    if use_tiles:
+        # TileLayer 默认用 GeoJsonLayer 渲染每块瓦片，样式属性会透传下去
+        poly_layer = pdk.Layer(
+            "TileLayer",
+            data=f"{TILE_URL}/tiles/{mode}/{year}/{cmap_name}/{{z}}/{{x}}/{{y}}.json",
+            min_zoom=0,
+            max_zoom=8,
+            tile_size=256,
+            pickable=True,
+            filled=True,
+            stroked=bool(show_edges),
+            get_fill_color="@@=properties.fill_color",
+            get_line_color=[0, 0, 0, 60],
+            line_width_min_pixels=0.5,
+            opacity=float(opacity),
+        )
+        tooltip_html = "<b>Temp</b>: {properties.temp_c} °C"
+    else:
+        poly_layer = pdk.Layer(
+            "PolygonLayer",
+            data=df_poly,
+            get_polygon="polygon",
+            pickable=True,
+            filled=True,
+            stroked=bool(show_edges),
+            get_fill_color="fill_color",
+            get_line_color=[0, 0, 0, 60],
+            line_width_min_pixels=0.5,
+            opacity=float(opacity),
+        )
+        tooltip_html = "<b>Temp</b>: {temp_c} °C"
+
+    view_state = pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=float(zoom), pitch=0)
 
     tooltip = {
-        "html": "<b>Temp</b>: {temp_c} °C",
+        "html": tooltip_html,
         "style": {"backgroundColor": "rgba(0,0,0,0.75)", "color": "white"},
     }
 
-    deck = pdk.Deck(
+    deck = CompactDeck(
         layers=[poly_layer],
         initial_view_state=view_state,
         map_style=BASEMAP,
         tooltip=tooltip,
     )
 
+    if DEBUG:
+        # 只在调试模式下额外序列化一次，拿到真实的 JSON payload 大小
+        with trace.stage("deck_to_json") as rec:
+            rec["bytes"] = len(deck.to_json().encode("utf-8"))
+
     # ✅ 监听 click 事件（返回事件 payload）
-    event = st_deckgl(deck, height=560, key="main_deck", events=["click"])
+    with trace.stage("st_deckgl"):
+        event = st_deckgl(deck, height=560, key="main_deck", events=["click"])
 
     # ---- Colorbar & slice info ----
     st.markdown("**Colorbar**")
-    st.pyplot(draw_colorbar(vmin, vmax, cmap_name), use_container_width=False)
+    with trace.stage("colorbar"):
+        st.pyplot(colorbar_job.result(), use_container_width=False)
 
     with st.expander("Current slice info"):
-        st.write(pd.Series(df_poly["temp_c"]).describe(percentiles=[0.05, 0.5, 0.95]))
+        st.write(pd.Series(slice_values).describe(percentiles=[0.05, 0.5, 0.95]))
+        if use_tiles:
+            st.caption(f"Tiled layer from {TILE_URL} (grid level chosen per tile)")
+        else:
+            st.caption(f"Grid level {level} ({dict(levels)[level]:g}°), {len(df_poly)} cells in view")
 
     # ----------------------------
     # 点击 -> 时间序列
@@ -358,17 +496,17 @@ with col_right:
         lon0 = float(st.session_state["clicked_lon"])
         st.write(f"Selected click: **lat={lat0:.4f}**, **lon={lon0:.4f}**")
 
-        years_ts, temps_ts, near_lat, near_lon = load_point_timeseries(mode, lat0, lon0)
-
-        # 目标范围：1940–2024（若文件不全，会自动按可用年份截取）
-        mask = (years_ts >= 1940) & (years_ts <= 2024)
-        years_ts = years_ts[mask]
-        temps_ts = temps_ts[mask]
+        if point_job is not None and point_args == (mode, lat0, lon0, series_version):
+            with st.spinner("Loading time series..."), trace.stage("join_point_series"):
+                years_ts, temps_ts, near_lat, near_lon, fig_ts = point_job.result()
+        else:
+            # 本次 rerun 才点的新位置：提前提交的任务（如果有）作废，直接在这里算
+            years_ts, temps_ts, near_lat, near_lon, fig_ts = point_series_figure(mode, lat0, lon0, series_version)
 
-        if len(years_ts) == 0:
+        if fig_ts is None:
             st.warning("该文件内没有落在 1940–2024 的年份数据（请检查 valid_time 覆盖范围）。")
         else:
-            st.pyplot(plot_timeseries(years_ts, temps_ts, mode, near_lat, near_lon), use_container_width=True)
+            st.pyplot(fig_ts, use_container_width=True)
 
             with st.expander("Point info"):
                 st.write(
@@ -382,6 +520,86 @@ with col_right:
                     }
                 )
 
+    # ----------------------------
+    # 导出
+    # ----------------------------
+    with st.expander("⬇️ Download data"):
+        export_formats = ["csv", "netcdf"] + (["parquet"] if export.parquet_available() else [])
+        export_fmt = st.radio("Format", export_formats, horizontal=True, key="export_format")
+        mime = export.FORMATS[export_fmt][0]
+
+        st.download_button(
+            "Current field (native grid)",
+            data=deferred_export(export.export_field, mode, year, export_fmt),
+            file_name=export.file_name(export.field_stem(mode, year), export_fmt),
+            mime=mime,
+            on_click="ignore",
+        )
+        if "clicked_lat" in st.session_state:
+            st.download_button(
+                "Clicked cell: annual + monthly series",
+                data=deferred_export(export.export_point, lat0, lon0, export_fmt),
+                file_name=export.file_name(export.point_stem(near_lat, near_lon), export_fmt),
+                mime=mime,
+                on_click="ignore",
+            )
+
+        st.markdown("**Region × years**")
+        south, north, west, span_lon = bounds
+        # 带 key 的输入框不会理会之后的 value=：视图（bounds）变了时直接改 session_state，
+        # 重新从当前视图开始；视图没变时保留用户手改的值
+        if st.session_state.get("export_bounds") != bounds:
+            st.session_state["export_bounds"] = bounds
+            st.session_state["export_south"] = float(max(south, -90.0))
+            st.session_state["export_north"] = float(min(north, 90.0))
+            st.session_state["export_west"] = float(era5_data.wrap_lon(west)) if span_lon < 360 else -180.0
+            st.session_state["export_east"] = float(era5_data.wrap_lon(west + span_lon)) if span_lon < 360 else 180.0
+        c1, c2, c3, c4 = st.columns(4)
+        cube_s = c1.number_input("South", -90.0, 90.0, key="export_south")
+        cube_n = c2.number_input("North", -90.0, 90.0, key="export_north")
+        cube_w = c3.number_input("West", -180.0, 180.0, key="export_west")
+        cube_e = c4.number_input("East", -180.0, 180.0, key="export_east")
+        cube_years = st.slider("Years", year_min, year_max, (year_min, year_max), key="export_years")
+        cube_query = (
+            f"mode={mode}&south={cube_s:g}&north={cube_n:g}&west={cube_w:g}&east={cube_e:g}"
+            f"&start={cube_years[0]}&end={cube_years[1]}&format={export_fmt}"
+        )
+        if TILE_URL:
+            st.link_button("Download region (streamed)", f"{TILE_URL}/export/cube?{cube_query}")
+        else:
+            st.caption("区域导出数据量可能很大，请用命令行（或启动 tile_server.py 并设置 GW_TILE_URL）：")
+            st.code(
+                f"python export.py cube --mode {mode} --bbox {cube_s:g} {cube_n:g} {cube_w:g} {cube_e:g} "
+                f"--years {cube_years[0]} {cube_years[1]} --format {export_fmt} -o "
+                f"{export.file_name(export.cube_stem(mode, *cube_years), export_fmt)}",
+                language="bash",
+            )
+
+trace.finish(mode=str(mode), year=int(year), cmap=cmap_name)
+
+if DEBUG:
+    with st.expander("🛠 Performance (debug)"):
+        st.write(f"本次 rerun 总耗时：**{trace.total_seconds * 1000:.1f} ms**")
+        st.dataframe(pd.DataFrame(trace.as_rows()), use_container_width=True, hide_index=True)
+
+        snap = metrics.REGISTRY.snapshot()
+        st.markdown(f"**本进程累计**（{snap['reruns']} 次 rerun）")
+        rows = []
+        for name, s in sorted(snap["stages"].items()):
+            lookups = s["hit"] + s["miss"]
+            rows.append(
+                {
+                    "stage": name,
+                    "calls": s["count"],
+                    "avg ms": round(s["seconds"] / s["count"] * 1000, 2),
+                    "max ms": round(s["max_seconds"] * 1000, 2),
+                    "bytes": s["bytes"],
+                    "hit rate": f"{s['hit'] / lookups:.0%}" if lookups else "",
+                }
+            )
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        st.code(metrics.REGISTRY.to_prometheus(), language="text")
+
 if st.button("See how each country is acting in response to climate change →"):
     st.switch_page("pages/Nation_Commitments.py")
 
@@ -0,0 +1,128 @@
+"""
+冷启动耗时基准：模拟一个新 worker 进程收到第一个请求。
+
+    python bench_startup.py [--repeat 3] [--data-dir ERA5_monthly] [--script Map_Interactive.py]
+
+每一轮都起一个全新的 Python 进程（import 缓存、st.cache_* 都是空的），分别测量：
+- import：页面顶层 import 的耗时（python -X importtime 的累计值，按模块列出最重的几个）
+- first run：AppTest 跑第一次脚本（包括页面里的延迟导入、读 manifest、取数据、画图）
+- second run：同一进程里再跑一次（模块和缓存都已就绪，相当于普通交互时的 rerun）
+- 第一次运行后哪些重模块被加载了（xarray / netCDF4 没有出现说明数据全部来自共享缓存）
+
+GW_SHARED_CACHE_DIR 等环境变量原样传给子进程；默认使用共享缓存，
+所以第二轮起的 first run 反映的是“机器上已有其他 worker 时新进程的启动”。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+
+HEAVY_MODULES = ("pandas", "xarray", "netCDF4", "matplotlib", "matplotlib.pyplot", "pydeck", "pyarrow")
+
+_CHILD = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t_import = time.perf_counter() - t0
+
+at = AppTest.from_file(sys.argv[1], default_timeout=300)
+t0 = time.perf_counter(); at.run(); first = time.perf_counter() - t0
+errors = [e.message for e in at.exception]
+loaded = [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+t0 = time.perf_counter(); at.run(); second = time.perf_counter() - t0
+print(json.dumps({"streamlit_import": t_import, "first_run": first, "second_run": second, "loaded": loaded, "errors": errors}))
+"""
+
+
+def import_profile(modules, top=8):
+    """python -X importtime：顶层模块的累计导入耗时（秒），取最重的 top 个。"""
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    top_level = {}
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"，嵌套导入的包名前有额外缩进
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative) / 1e6
+    return sorted(top_level.items(), key=lambda kv: -kv[1])[:top]
+
+
+def page_imports(script):
+    """脚本顶层 import 的本地和第三方模块名。"""
+    names = []
+    for line in (APP_DIR / script).read_text(encoding="utf-8").splitlines():
+        parts = line.split()
+        if line.startswith("import ") and len(parts) >= 2:
+            names.append(parts[1].rstrip(","))
+        elif line.startswith("from ") and len(parts) >= 2 and not parts[1].startswith("."):
+            names.append(parts[1])
+    # 页面脚本本身会调用 st.set_page_config 等，不能直接 import；这里只测它依赖的模块
+    return [n for n in dict.fromkeys(names) if n != "__future__"]
+
+
+def run_once(script):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(APP_DIR), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-c", _CHILD, str(APP_DIR / script), json.dumps(HEAVY_MODULES)],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"benchmark run failed (exit {proc.returncode})")
+    return json.loads(lines[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the Streamlit pages")
+    parser.add_argument("--script", default="Map_Interactive.py")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", help="sets GW_DATA_DIR for the runs")
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        os.environ["GW_DATA_DIR"] = str(Path(args.data_dir).resolve())
+
+    modules = page_imports(args.script)
+    print(f"top-level imports of {args.script}: {', '.join(modules)}")
+    for name, seconds in import_profile(modules):
+        print(f"  {name:<24} {seconds * 1000:8.1f} ms")
+
+    results = []
+    for k in range(args.repeat):
+        r = run_once(args.script)
+        results.append(r)
+        print(
+            f"run {k + 1}: streamlit import {r['streamlit_import'] * 1000:7.1f} ms   "
+            f"first run {r['first_run'] * 1000:8.1f} ms   second run {r['second_run'] * 1000:7.1f} ms   "
+            f"loaded: {', '.join(r['loaded']) or '-'}"
+        )
+        for err in r["errors"]:
+            print(f"  exception: {err}")
+
+    firsts = [r["first_run"] for r in results]
+    seconds = [r["second_run"] for r in results]
+    print(
+        f"median first run {statistics.median(firsts) * 1000:.1f} ms, "
+        f"median second run {statistics.median(seconds) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+国家边界栅格化 + 按国家的面积加权平均气温序列（不依赖 streamlit）。
+
+    python countries.py [--data-dir ERA5_monthly] build [--subsample N]
+    python countries.py [--data-dir ERA5_monthly] series --country China [--mode Annual]
+
+boundaries/ne_110m_admin0_countries.geojson（Natural Earth 1:110m，公有领域）只在构建时读一次：
+每个 ERA5 格子细分成 N x N 个子格，用子格中心做点在多边形内判断，得到整数国家编号栅格
+（0 = 海洋 / 无国家），存成 ERA5_monthly/country_labels.npz。网格或边界文件变化时自动重建。
+
+之后任意 mode 下所有国家的逐年平均都只要每年一次加权 bincount，请求时不再做任何多边形判断：
+    means = bincount(labels, weights=w * T[parent]) / bincount(labels, weights=w)
+子格让一个格子按覆盖面积分给不同国家（小国家也能分到一部分），w = cos(lat) 是面积权重。
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import era5_data
+from era5_data import APP_DIR, DATA_DIR, all_modes, file_for_mode
+
+BOUNDARY_FILE = APP_DIR / "boundaries" / "ne_110m_admin0_countries.geojson"
+LABELS_FILE = "country_labels.npz"
+LABELS_VERSION = 1
+
+# 子格目标分辨率（度）：2° 网格默认每格 4x4 个子格
+SUBCELL_DEG = 0.5
+
+
+def load_boundaries(path=BOUNDARY_FILE):
+    """GeoJSON -> [(name, iso_a3, [polygon, ...])]，polygon 为若干个 (n, 2) 环（第一个是外环，其余是洞）。"""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    countries = []
+    for feat in data["features"]:
+        geom = feat["geometry"]
+        polys = geom["coordinates"] if geom["type"] == "MultiPolygon" else [geom["coordinates"]]
+        rings = [[np.asarray(ring, dtype=np.float64) for ring in poly] for poly in polys]
+        countries.append((feat["properties"]["name"], feat["properties"].get("iso_a3", ""), rings))
+    return countries
+
+
+def points_in_polygon(px, py, rings):
+    """偶奇规则（射线法）：所有环一起算，洞自然被扣掉。px/py 为一维数组。"""
+    inside = np.zeros(px.shape, dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:-1, 0], ring[:-1, 1]
+        x2, y2 = ring[1:, 0], ring[1:, 1]
+        for k in range(len(x1)):
+            if y1[k] == y2[k]:
+                continue
+            crosses = (y1[k] > py) != (y2[k] > py)
+            x_at = (x2[k] - x1[k]) * (py - y1[k]) / (y2[k] - y1[k]) + x1[k]
+            inside ^= crosses & (px < x_at)
+    return inside
+
+
+def subcell_centers(centers, subsample):
+    """每个格子等分成 subsample 份后的子格中心（顺序与 centers 一致）。"""
+    edges = era5_data.edges_from_centers(centers)
+    frac = (np.arange(subsample) + 0.5) / subsample
+    return (edges[:-1, None] + (edges[1:] - edges[:-1])[:, None] * frac[None, :]).ravel()
+
+
+def rasterize(countries, lat, lon, subsample):
+    """-> 子格国家编号 (len(lat)*s, len(lon)*s)，int16，0 表示不属于任何国家。"""
+    sub_lat = subcell_centers(lat, subsample)
+    sub_lon = era5_data.wrap_lon(subcell_centers(lon, subsample))
+    labels = np.zeros((len(sub_lat), len(sub_lon)), dtype=np.int16)
+    for code, (_, _, polys) in enumerate(countries, start=1):
+        for rings in polys:
+            outer = rings[0]
+            # 只在外环的包围盒里做判断
+            rows = np.flatnonzero((sub_lat >= outer[:, 1].min()) & (sub_lat <= outer[:, 1].max()))
+            cols = np.flatnonzero((sub_lon >= outer[:, 0].min()) & (sub_lon <= outer[:, 0].max()))
+            if len(rows) == 0 or len(cols) == 0:
+                continue
+            py, px = np.meshgrid(sub_lat[rows], sub_lon[cols], indexing="ij")
+            inside = points_in_polygon(px.ravel(), py.ravel(), rings).reshape(py.shape)
+            block = labels[np.ix_(rows, cols)]
+            block[inside] = code
+            labels[np.ix_(rows, cols)] = block
+    return labels
+
+
+def reference_grid(data_dir=DATA_DIR):
+    """页面使用的网格：read_year_field 输出的 (lat, lon)（经度已转成 -180..180 并排序）。"""
+    for mode in all_modes():
+        path = file_for_mode(mode, 0, data_dir)
+        if path.exists():
+            year = int(era5_data.read_years(path)[0])
+            lat, lon, _ = era5_data.read_year_field(path, year)
+            return lat, lon
+    raise FileNotFoundError(f"no ERA5 files in {data_dir}")
+
+
+def _boundary_stamp(path=BOUNDARY_FILE):
+    st_ = os.stat(path)
+    return f"{Path(path).name}:{st_.st_size}:{st_.st_mtime_ns}"
+
+
+def build_labels(data_dir=DATA_DIR, subsample=None, boundary_file=BOUNDARY_FILE):
+    lat, lon = reference_grid(data_dir)
+    res = float(np.median(np.abs(np.diff(lon)))) if len(lon) > 1 else 360.0
+    if subsample is None:
+        subsample = max(1, int(round(res / SUBCELL_DEG)))
+    countries = load_boundaries(boundary_file)
+    return {
+        "version": np.int64(LABELS_VERSION),
+        "labels": rasterize(countries, lat, lon, subsample),
+        "subsample": np.int64(subsample),
+        "lat": lat,
+        "lon": lon,
+        "names": np.array([c[0] for c in countries]),
+        "iso": np.array([c[1] for c in countries]),
+        "boundary": np.array(_boundary_stamp(boundary_file)),
+    }
+
+
+def labels_path(data_dir=DATA_DIR):
+    return Path(data_dir) / LABELS_FILE
+
+
+def read_labels(data_dir=DATA_DIR):
+    try:
+        with np.load(labels_path(data_dir), allow_pickle=False) as npz:
+            grid = {k: npz[k] for k in npz.files}
+    except (OSError, ValueError):
+        return None
+    if int(grid.get("version", -1)) != LABELS_VERSION:
+        return None
+    return grid
+
+
+def write_labels(grid, data_dir=DATA_DIR):
+    path = labels_path(data_dir)
+    tmp = path.with_name(f".{path.stem}.{os.getpid()}.tmp.npz")
+    try:
+        np.savez_compressed(tmp, **grid)
+        os.replace(tmp, path)
+    except BaseException:
+        # 写了一半（磁盘满、只读等）：不留下临时文件
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def is_stale(grid, data_dir=DATA_DIR):
+    if grid is None:
+        return True
+    if str(grid["boundary"]) != _boundary_stamp():
+        return True
+    lat, lon = reference_grid(data_dir)
+    return not (np.array_equal(grid["lat"], lat) and np.array_equal(grid["lon"], lon))
+
+
+def load_or_build(data_dir=DATA_DIR):
+    """读 country_labels.npz；不存在或与当前网格 / 边界文件不符时重建并写回。"""
+    grid = read_labels(data_dir)
+    if not is_stale(grid, data_dir):
+        return grid
+    grid = build_labels(data_dir)
+    try:
+        write_labels(grid, data_dir)
+    except OSError:
+        # 数据目录只读（PermissionError / EROFS）或写不下：照样用内存里的结果，只是下次还要重建
+        pass
+    return grid
+
+
+# ----------------------------
+# 按国家聚合
+# ----------------------------
+class CountryIndex:
+    """
+    预先展开好的 bincount 输入：只保留落在某个国家里的子格。
+    labels/parent/weights 都是一维数组，长度 = 陆地子格数。
+    """
+
+    def __init__(self, grid):
+        s = int(grid["subsample"])
+        nlat, nlon = len(grid["lat"]), len(grid["lon"])
+        labels = grid["labels"]
+        rows, cols = np.nonzero(labels)
+        self.names = [str(n) for n in grid["names"]]
+        self.iso = [str(i) for i in grid["iso"]]
+        self.n = len(self.names)
+        self.labels = labels[rows, cols].astype(np.intp)
+        self.parent = (rows // s) * nlon + (cols // s)
+        sub_lat = subcell_centers(grid["lat"], s)
+        self.weights = np.cos(np.deg2rad(sub_lat))[rows]
+        self.shape = (nlat, nlon)
+        # 标签栅格的版本（放进缓存 key）：边界文件 + 子格数 + 网格大小
+        self.version = f"v{LABELS_VERSION}:{grid['boundary']}:{s}:{nlat}x{nlon}"
+        # 没有 NaN 时分母每年都一样，只算一次
+        self._den = np.bincount(self.labels, weights=self.weights, minlength=self.n + 1)
+
+    def position(self, name):
+        """国家名（或 ISO 代码）-> 在 names 里的下标；找不到返回 None。"""
+        for k, (n, iso) in enumerate(zip(self.names, self.iso)):
+            if name in (n, iso):
+                return k
+        return None
+
+    def means(self, temp_c):
+        """一帧 -> 所有国家的面积加权平均 (n,)；没有格子的国家为 NaN。"""
+        if temp_c.shape != self.shape:
+            raise ValueError(f"field shape {temp_c.shape} does not match label grid {self.shape}")
+        vals = np.asarray(temp_c, dtype=np.float64).ravel()[self.parent]
+        ok = np.isfinite(vals)
+        if ok.all():
+            num = np.bincount(self.labels, weights=self.weights * vals, minlength=self.n + 1)
+            den = self._den
+        else:
+            num = np.bincount(self.labels[ok], weights=self.weights[ok] * vals[ok], minlength=self.n + 1)
+            den = np.bincount(self.labels[ok], weights=self.weights[ok], minlength=self.n + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (num / den)[1:]
+
+
+def country_series(index, mode, data_dir=DATA_DIR):
+    """某个 mode 下所有国家的逐年平均：years (n_years,), means (n_years, n_countries)，float32。"""
+    path = file_for_mode(mode, 0, data_dir)
+    years = era5_data.read_years(path)
+    means = np.empty((len(years), index.n), dtype=np.float32)
+    for k, year in enumerate(years):
+        _, _, temp_c = era5_data.read_year_field(path, int(year))
+        means[k] = index.means(temp_c)
+    return np.asarray(years, dtype=np.int64), means
+
+
+def annual_series(index, data_dir=DATA_DIR):
+    """年平均：有年平均文件就直接用，否则取 12 个月都有数据的年份做月平均。"""
+    if file_for_mode("Annual", 0, data_dir).exists():
+        return country_series(index, "Annual", data_dir)
+    monthly = [country_series(index, m, data_dir) for m in range(1, 13) if file_for_mode(m, 0, data_dir).exists()]
+    if len(monthly) < 12:
+        raise FileNotFoundError("need either the annual-mean file or all 12 monthly files")
+    years = monthly[0][0]
+    for y, _ in monthly[1:]:
+        years = np.intersect1d(years, y)
+    stack = [m[np.searchsorted(y, years)] for y, m in monthly]
+    return years, np.mean(stack, axis=0).astype(np.float32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Country label grid and country-mean temperature series")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("build", help="rasterize country borders onto the ERA5 grid")
+    p.add_argument("--subsample", type=int, default=None, help="sub-cells per grid cell and axis")
+
+    p = sub.add_parser("series", help="print a country's mean temperature per year")
+    p.add_argument("--country", required=True, help="name or ISO-3 code, e.g. China or CHN")
+    p.add_argument("--mode", default="Annual")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "build":
+        grid = build_labels(args.data_dir, args.subsample)
+        write_labels(grid, args.data_dir)
+        covered = len(np.unique(grid["labels"])) - 1
+        print(f"wrote {labels_path(args.data_dir)}: {grid['labels'].shape} sub-cells, {covered}/{len(grid['names'])} countries covered")
+        return 0
+
+    index = CountryIndex(load_or_build(args.data_dir))
+    k = index.position(args.country)
+    if k is None:
+        print(f"unknown country: {args.country}", file=sys.stderr)
+        return 1
+    if args.mode.lower() == "annual":
+        years, means = annual_series(index, args.data_dir)
+    else:
+        years, means = country_series(index, int(args.mode), args.data_dir)
+    for year, value in zip(years, means[:, k]):
+        print(f"{year}\t{value:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+"""
+ERA5 数据读取（不依赖 streamlit，命令行工具和页面共用）。
+
+读取都是“按需”的：只解码 valid_time 轴，再用 isel 取需要的那一年 / 那一个格点，
+不会把整个 (time, lat, lon) 变量读进内存，所以 0.25° 这种大网格也能直接用。
+
+xarray / netCDF4 / matplotlib 都在用到的函数里才 import：页面在共享缓存命中时
+根本不需要打开 NetCDF，新进程也就不必为它们付导入时间。
+
+文件句柄放在进程级的 POOL 里复用（不再每次 open/close）。netCDF4/HDF5 C 库不是线程安全的，
+而 Streamlit 每个 session 跑在自己的线程里，所以所有读取都在 POOL 的锁里串行进行；
+文件在磁盘上被替换（mtime/size/inode 变化）时自动关掉旧句柄重新打开。
+
+多分辨率金字塔（可选）：
+    python era5_data.py build-pyramid [--coarsest 4]
+会在 ERA5_monthly/pyramid/level_<k>/ 下生成逐级 2x2 粗化的同名文件
+（例如 0.25° -> 0.5° -> 1° -> 2° -> 4°），页面按地图缩放级别自动选用。
+"""
+import argparse
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = Path(__file__).resolve().parent
+
+# ERA5 数据目录（默认与 Map_Interactive.py 同级；可用 GW_DATA_DIR 覆盖）
+DATA_DIR = Path(os.environ.get("GW_DATA_DIR", APP_DIR / "ERA5_monthly"))
+
+MONTH_FILE_TMPL = "t2m_2deg_month_{:02d}.nc"
+ANNUAL_FILE = "t2m_2deg_annual_mean.nc"
+
+PYRAMID_DIR = "pyramid"
+PYRAMID_INDEX = "levels.json"
+
+# 一帧 PolygonLayer 最多画多少个格子（超过就换更粗的层级），约等于 2° 全球网格
+MAX_CELLS = 20000
+
+
+def k_to_c(k):
+    return k - 273.15
+
+
+def wrap_lon(lon):
+    """经度规范化到 [-180, 180)。"""
+    return ((np.asarray(lon, dtype=np.float64) + 180) % 360) - 180
+
+
+def all_modes():
+    return ["Annual"] + list(range(1, 13))
+
+
+def file_name_for_mode(mode):
+    # mode: "Annual" 或 1..12
+    if mode == "Annual":
+        return ANNUAL_FILE
+    else:
+        return MONTH_FILE_TMPL.format(int(mode))
+
+
+def level_dir(level=0, data_dir=DATA_DIR):
+    """level 0 是原始数据，level k 是粗化 2**k 倍的金字塔层。"""
+    data_dir = Path(data_dir)
+    if int(level) == 0:
+        return data_dir
+    return data_dir / PYRAMID_DIR / f"level_{int(level)}"
+
+
+def file_for_mode(mode, level=0, data_dir=DATA_DIR):
+    return level_dir(level, data_dir) / file_name_for_mode(mode)
+
+
+def _file_stamp(path):
+    st_ = os.stat(path)
+    return (st_.st_mtime_ns, st_.st_size, st_.st_ino)
+
+
+class DatasetPool:
+    """
+    进程级 xr.Dataset 句柄池。
+    用法：with POOL.open(path) as ds: ...（整个 with 块持有全局读锁）
+    """
+
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        # 同一线程里嵌套调用不会死锁
+        self._lock = threading.RLock()
+        self._handles = OrderedDict()  # path -> (stamp, ds)
+
+    @contextmanager
+    def open(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            stamp = _file_stamp(path)
+            entry = self._handles.get(path)
+            if entry is not None and entry[0] != stamp:
+                # 文件被替换/追加过：旧句柄作废
+                entry[1].close()
+                del self._handles[path]
+                entry = None
+            if entry is None:
+                import xarray as xr
+
+                # cache=False：常驻句柄不要把读过的整块变量缓存在 Dataset 上
+                entry = (stamp, xr.open_dataset(path, cache=False))
+                self._handles[path] = entry
+                while len(self._handles) > self.max_open:
+                    _, (_, old) = self._handles.popitem(last=False)
+                    old.close()
+            else:
+                self._handles.move_to_end(path)
+            yield entry[1]
+
+    def invalidate(self, path=None):
+        """关掉某个文件（或全部）的句柄，下次使用时重新打开。"""
+        with self._lock:
+            paths = list(self._handles) if path is None else [os.path.abspath(path)]
+            for p in paths:
+                entry = self._handles.pop(p, None)
+                if entry is not None:
+                    entry[1].close()
+
+    def stats(self):
+        """(打开的句柄数, 0)——给 memory_report 用；句柄本身不缓存数据。"""
+        with self._lock:
+            return len(self._handles), 0
+
+
+POOL = DatasetPool()
+
+
+def read_years(path):
+    """文件覆盖的年份（只解码 valid_time）。"""
+    with POOL.open(path) as ds:
+        return np.unique(pd.to_datetime(ds["valid_time"].values).year)
+
+
+def read_year_field(path, year):
+    """
+    读取某个文件里某一年的气温场（只读该年的时间切片）。
+    输出：lat(1d), lon(1d, -180..180 已排序), temp_c(2d: lat x lon, float32)
+    """
+    with POOL.open(path) as ds:
+        time_index = pd.to_datetime(ds["valid_time"].values)
+        idx = np.flatnonzero(time_index.year == int(year))
+        if len(idx) == 0:
+            raise ValueError(f"No data for year={year} in {Path(path).name}")
+
+        # 取该年的时间点（保险起见：若不止一个就平均）
+        t2m = ds["t2m"].isel(valid_time=idx).values
+        field = t2m.mean(axis=0) if t2m.shape[0] > 1 else t2m[0]
+
+        lat = ds["latitude"].values
+        lon = ds["longitude"].values
+
+    # 经度 0..360 -> -180..180，并排序（防止日界线断裂）；只对这一帧做，不动整个变量
+    lon_fixed = wrap_lon(lon)
+    order = np.argsort(lon_fixed, kind="stable")
+    temp_c = k_to_c(field[:, order]).astype(np.float32)
+    return lat, lon_fixed[order], temp_c
+
+
+def nearest_index(lat, lon, lat0, lon0):
+    """
+    最近邻格点的下标 (i, j)。lon 可以是 0..360 或 -180..180，
+    点击经度也规范化到 [-180, 180)，按环形距离比较。
+    """
+    lon_fixed = wrap_lon(lon)
+    lon0_fixed = float(wrap_lon(float(lon0)))
+    i = int(np.argmin(np.abs(np.asarray(lat) - float(lat0))))
+    dlon = np.abs(lon_fixed - lon0_fixed)
+    j = int(np.argmin(np.minimum(dlon, 360 - dlon)))
+    return i, j
+
+
+def read_coords(path):
+    """(lat, lon) 原始坐标（不排序）。"""
+    with POOL.open(path) as ds:
+        return ds["latitude"].values, ds["longitude"].values
+
+
+def read_point_timeseries(path, lat0, lon0):
+    """
+    读取最近邻格点的逐年序列（只读这一个格点的时间序列）。
+    返回：years(1d), temps_c(1d), nearest_lat, nearest_lon
+    """
+    lat, lon = read_coords(path)
+    i, j = nearest_index(lat, lon, lat0, lon0)
+    years, temps_c = read_point_series(path, i, j)
+    return years, temps_c, float(lat[i]), float(wrap_lon(lon[j]))
+
+
+def read_point_series(path, i, j):
+    """格点 (i, j) 的逐年序列：years(1d), temps_c(1d)。"""
+    with POOL.open(path) as ds:
+        values = ds["t2m"].isel(latitude=i, longitude=j).values
+        years_all = pd.to_datetime(ds["valid_time"].values).year
+
+    # 保险起见按年聚合（即使一年有多时刻也能处理）
+    df = pd.DataFrame({"year": years_all, "t2m": values})
+    series = df.groupby("year")["t2m"].mean()
+
+    years = series.index.values.astype(int)
+    temps_c = k_to_c(series.values).astype(np.float32)
+    return years, temps_c
+
+
+def read_grid_info(path):
+    """网格大小和分辨率（只读坐标）。"""
+    with POOL.open(path) as ds:
+        lat = ds["latitude"].values
+        lon = ds["longitude"].values
+    res = float(np.median(np.abs(np.diff(lon)))) if len(lon) > 1 else 360.0
+    return {"nlat": int(len(lat)), "nlon": int(len(lon)), "res_deg": res}
+
+
+def edges_from_centers(arr):
+    """
+    给定中心点坐标（等间距），返回边界坐标。
+    例：centers=[...], edges 长度 = len(centers)+1
+    递减的坐标（ERA5 的纬度是 90 -> -90）也适用：步长带符号。
+    """
+    arr = np.asarray(arr, dtype=np.float64)
+    d = np.diff(arr)
+    step = np.median(d) if len(d) else 1.0
+    edges = np.empty(len(arr) + 1, dtype=np.float64)
+    edges[1:-1] = (arr[:-1] + arr[1:]) / 2.0
+    edges[0] = arr[0] - step / 2.0
+    edges[-1] = arr[-1] + step / 2.0
+    return edges
+
+
+def color_limits(temp_c):
+    """色标范围：2%~98% 分位数（整帧计算，保证分块/分瓦片时颜色一致）。"""
+    vals = np.asarray(temp_c).ravel()
+    vals = vals[np.isfinite(vals)]
+    vmin = float(np.nanpercentile(vals, 2))
+    vmax = float(np.nanpercentile(vals, 98))
+    if vmax <= vmin:
+        vmax = vmin + 1.0
+    return vmin, vmax
+
+
+@lru_cache(maxsize=None)
+def colormap(name):
+    """
+    进程内共用的 Colormap 对象。
+    mpl.colormaps[name] 每次都返回一份新拷贝，第一次取色时还要重新生成查找表；这里每个色标只建一次。
+    """
+    import matplotlib as mpl
+
+    cmap = mpl.colormaps[name]
+    cmap(0.5)  # 触发查找表初始化
+    return cmap
+
+
+def colorize(values, vmin, vmax, cmap_name="turbo"):
+    """values(任意形状) -> uint8 RGB，形状 values.shape + (3,)。"""
+    import matplotlib as mpl
+
+    norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax)
+    return (colormap(cmap_name)(norm(values))[..., :3] * 255).astype(np.uint8)
+
+
+def draw_colorbar(vmin, vmax, cmap_name="turbo"):
+    """水平色标（matplotlib Figure，不经过 pyplot，可在线程 / 子进程里画）。"""
+    import matplotlib as mpl
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(7.2, 0.55), dpi=160)
+    ax = fig.subplots()
+    fig.subplots_adjust(bottom=0.45)
+    norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax)
+    cb = mpl.colorbar.ColorbarBase(ax, cmap=colormap(cmap_name), norm=norm, orientation="horizontal")
+    cb.set_label("Temperature (°C)")
+    return fig
+
+
+# ----------------------------
+# 缩放级别 -> 金字塔层级
+# ----------------------------
+def view_bounds(lat, lon, zoom, width_px=1200, height_px=560):
+    """
+    Web Mercator 下某个视图大致覆盖的范围：(south, north, west, span_lon)。
+    span_lon >= 360 表示整圈经度都可见。
+    """
+    world_px = 256 * 2 ** float(zoom)
+    span_lon = width_px / world_px * 360.0
+
+    lat = max(min(float(lat), 85.0), -85.0)
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    half = height_px / world_px * math.pi
+    north = math.degrees(2 * math.atan(math.exp(y + half)) - math.pi / 2)
+    south = math.degrees(2 * math.atan(math.exp(y - half)) - math.pi / 2)
+    west = float(lon) - span_lon / 2
+    return south, north, west, span_lon
+
+
+def crop_to_view(lat, lon, temp_c, bounds):
+    """
+    把 (lat, lon, temp_c) 裁到视图范围（多留一格）。
+    跨日界线时经度会被展开成连续值（例如 170..190），deck.gl 可以直接画。
+    """
+    south, north, west, span_lon = bounds
+    if span_lon >= 360 and south <= float(np.min(lat)) and north >= float(np.max(lat)):
+        return lat, lon, temp_c
+
+    step_lat = float(np.median(np.abs(np.diff(lat)))) if len(lat) > 1 else 0.0
+    rows = np.flatnonzero((lat >= south - step_lat) & (lat <= north + step_lat))
+
+    if span_lon >= 360:
+        cols = np.arange(len(lon))
+        lon_out = lon
+    else:
+        step_lon = float(np.median(np.abs(np.diff(lon)))) if len(lon) > 1 else 0.0
+        offset = (np.asarray(lon) - (west - step_lon)) % 360
+        cols = np.flatnonzero(offset <= span_lon + 2 * step_lon)
+        cols = cols[np.argsort(offset[cols], kind="stable")]
+        lon_out = (west - step_lon) + offset[cols]
+
+    return lat[rows], lon_out, temp_c[np.ix_(rows, cols)]
+
+
+def choose_level(levels, bounds, max_cells=MAX_CELLS, min_cell_px=2.0, zoom=1.0, mode=None, data_dir=DATA_DIR):
+    """
+    levels: [(level, res_deg), ...]（任意顺序）
+    选最细、且视图内格子数不超过 max_cells、且每格至少 min_cell_px 像素的层级。
+    给了 mode 时只在这个 mode 确实有文件的层级里选（比如 build-pyramid 之后才加进来的 mode 只有原始层）。
+    """
+    if mode is not None:
+        levels = [lv for lv in levels if lv[0] == 0 or file_for_mode(mode, lv[0], data_dir).exists()] or levels
+    south, north, _, span_lon = bounds
+    span_lon = min(span_lon, 360.0)
+    span_lat = max(north - south, 0.0)
+    px_per_deg = 256 * 2 ** float(zoom) / 360.0
+
+    ordered = sorted(levels, key=lambda lv: lv[1])
+    for level, res in ordered:
+        cells = (span_lat / res) * (span_lon / res)
+        if cells <= max_cells and res * px_per_deg >= min_cell_px:
+            return level
+    return ordered[-1][0]
+
+
+def read_pyramid_levels(data_dir=DATA_DIR):
+    """[(level, res_deg), ...]；没有金字塔时只有原始层（res 为 None，由调用方补上）。"""
+    index = Path(data_dir) / PYRAMID_DIR / PYRAMID_INDEX
+    if not index.exists():
+        return [(0, None)]
+    info = json.loads(index.read_text(encoding="utf-8"))
+    return [(int(lv["level"]), float(lv["res_deg"])) for lv in info["levels"]]
+
+
+def pyramid_stamp(data_dir=DATA_DIR):
+    """levels.json 的 mtime_ns（没有金字塔时为 None）：缓存 read_pyramid_levels 的结果时放进 key。"""
+    try:
+        return (Path(data_dir) / PYRAMID_DIR / PYRAMID_INDEX).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# ----------------------------
+# 金字塔构建（分块读写，内存只占几个时间切片）
+# ----------------------------
+def coarsen2(block):
+    """(t, lat, lon) 按 2x2 求平均（忽略 NaN）；奇数尺寸时丢掉最后一行/列。"""
+    t, ny, nx = block.shape
+    ny2, nx2 = ny // 2, nx // 2
+    b = block[:, : ny2 * 2, : nx2 * 2].reshape(t, ny2, 2, nx2, 2)
+    valid = np.isfinite(b)
+    total = np.where(valid, b, 0.0).sum(axis=(2, 4), dtype=np.float64)
+    count = valid.sum(axis=(2, 4))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = total / count
+    return out.astype(np.float32)
+
+
+def _coarsen_coord(c):
+    n2 = len(c) // 2
+    return c[: n2 * 2].reshape(n2, 2).mean(axis=1)
+
+
+def coarsen_file(src_path, dst_path, time_chunk=12):
+    """把一个文件粗化 2 倍写到 dst_path（netCDF4，逐 time_chunk 个时间步处理）。"""
+    import netCDF4
+
+    dst_path = Path(dst_path)
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dst_path.with_suffix(".nc.tmp")
+
+    with netCDF4.Dataset(src_path) as src, netCDF4.Dataset(tmp_path, "w") as dst:
+        src_t = src.variables["valid_time"]
+        lat = _coarsen_coord(np.asarray(src.variables["latitude"][:], dtype=np.float64))
+        lon = _coarsen_coord(np.asarray(src.variables["longitude"][:], dtype=np.float64))
+        nt = len(src_t)
+
+        dst.createDimension("valid_time", None)
+        dst.createDimension("latitude", len(lat))
+        dst.createDimension("longitude", len(lon))
+
+        t_var = dst.createVariable("valid_time", src_t.dtype, ("valid_time",))
+        t_var.setncatts({k: src_t.getncattr(k) for k in src_t.ncattrs() if k != "_FillValue"})
+        t_var[:] = src_t[:]
+
+        for name, values in (("latitude", lat), ("longitude", lon)):
+            v = dst.createVariable(name, "f8", (name,))
+            v.setncatts({k: src.variables[name].getncattr(k) for k in src.variables[name].ncattrs() if k != "_FillValue"})
+            v[:] = values
+
+        src_v = src.variables["t2m"]
+        out = dst.createVariable(
+            "t2m",
+            "f4",
+            ("valid_time", "latitude", "longitude"),
+            zlib=True,
+            complevel=4,
+            chunksizes=(1, len(lat), len(lon)),
+            fill_value=np.float32(np.nan),
+        )
+        out.setncatts({k: src_v.getncattr(k) for k in src_v.ncattrs() if k not in ("_FillValue", "scale_factor", "add_offset")})
+        dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+
+        for t0 in range(0, nt, time_chunk):
+            t1 = min(t0 + time_chunk, nt)
+            block = np.ma.filled(np.ma.asarray(src_v[t0:t1], dtype=np.float32), np.nan)
+            out[t0:t1] = coarsen2(block)
+
+    os.replace(tmp_path, dst_path)
+
+
+def build_pyramid(data_dir=DATA_DIR, coarsest=4.0, time_chunk=12, log=print):
+    """
+    从原始文件开始逐级粗化：level_k 由 level_{k-1} 生成，直到分辨率达到 coarsest 度。
+    已是最新的层会跳过（增量）；写 pyramid/levels.json 记录每层分辨率。
+    """
+    data_dir = Path(data_dir)
+    sources = [m for m in all_modes() if file_for_mode(m, 0, data_dir).exists()]
+    if not sources:
+        raise FileNotFoundError(f"No ERA5 files in {data_dir}")
+
+    base_res = read_grid_info(file_for_mode(sources[0], 0, data_dir))["res_deg"]
+    levels = [{"level": 0, "res_deg": base_res}]
+    n_levels = 0
+    while base_res * 2 ** (n_levels + 1) <= float(coarsest) + 1e-9:
+        n_levels += 1
+    for level in range(1, n_levels + 1):
+        for mode in sources:
+            src = file_for_mode(mode, level - 1, data_dir)
+            dst = file_for_mode(mode, level, data_dir)
+            if dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+                continue
+            log(f"level {level}: {src.name}")
+            coarsen_file(src, dst, time_chunk=time_chunk)
+        levels.append({"level": level, "res_deg": base_res * 2 ** level})
+
+    index = data_dir / PYRAMID_DIR / PYRAMID_INDEX
+    index.parent.mkdir(parents=True, exist_ok=True)
+    index.write_text(json.dumps({"levels": levels}, indent=2), encoding="utf-8")
+    return levels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ERA5 data tools")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("build-pyramid", help="precompute coarsened levels (2x per level)")
+    p.add_argument("--coarsest", type=float, default=4.0, help="stop at this resolution (degrees)")
+    p.add_argument("--time-chunk", type=int, default=12)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "build-pyramid":
+        levels = build_pyramid(args.data_dir, coarsest=args.coarsest, time_chunk=args.time_chunk)
+        for lv in levels:
+            print(f"level {lv['level']}: {lv['res_deg']:g}°")
+
+
+if __name__ == "__main__":
+    main()
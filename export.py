@@ -0,0 +1,336 @@
+"""
+批量导出：当前气温场、某个格点的逐月 + 年平均序列、按经纬度范围和年份范围裁出的数据立方体。
+
+所有导出都按块生成（一次一个时间切片 / 几千行），不会先拼出完整的 DataFrame：
+- CSV 直接逐块 yield
+- NetCDF / Parquet 不是流式格式：逐块追加写到临时文件，再按 1 MB 分块读出、删掉临时文件
+
+命令行：
+    python export.py field --mode 7 --year 2000 --format csv -o field.csv
+    python export.py point --lat 40 --lon 116 -o point.csv
+    python export.py cube --mode Annual --bbox 20 55 70 140 --years 1990 2020 --format netcdf -o cube.nc
+
+HTTP（由 tile_server.py 提供，分块传输）：
+    /export/field?mode=7&year=2000&format=csv
+    /export/point?lat=40&lon=116
+    /export/cube?mode=Annual&south=20&north=55&west=70&east=140&start=1990&end=2020&format=netcdf
+"""
+import argparse
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import era5_data
+from era5_data import all_modes, file_for_mode
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "netcdf": ("application/x-netcdf", "nc"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+CSV_ROWS_PER_CHUNK = 20000
+FILE_CHUNK_BYTES = 1 << 20
+
+
+def parquet_available():
+    # 只查找不导入：页面每次 rerun 都会调用
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def parse_mode(value):
+    return "Annual" if str(value).lower() == "annual" else int(value)
+
+
+def _mode_label(mode):
+    return "annual" if mode == "Annual" else f"month{int(mode):02d}"
+
+
+def field_stem(mode, year):
+    return f"t2m_{_mode_label(mode)}_{int(year)}"
+
+
+def point_stem(lat, lon):
+    return f"t2m_point_{lat:.2f}_{lon:.2f}"
+
+
+def cube_stem(mode, year_start, year_end):
+    return f"t2m_{_mode_label(mode)}_{int(year_start)}-{int(year_end)}"
+
+
+def file_name(stem, fmt):
+    return f"{stem}.{FORMATS[fmt][1]}"
+
+
+# ----------------------------
+# 数据源（全部按块读取）
+# ----------------------------
+def iter_field_blocks(lat, lon, temp_c, rows_per_chunk=CSV_ROWS_PER_CHUNK):
+    """一帧 -> 逐块 DataFrame(lat, lon, temp_c)，跳过 NaN。"""
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+    rows_per_block = max(1, rows_per_chunk // max(len(lon), 1))
+    for i0 in range(0, len(lat), rows_per_block):
+        block = np.asarray(temp_c[i0 : i0 + rows_per_block])
+        la = np.repeat(lat[i0 : i0 + rows_per_block], len(lon))
+        lo = np.tile(lon, block.shape[0])
+        vals = block.ravel()
+        ok = np.isfinite(vals)
+        yield pd.DataFrame({"lat": la[ok], "lon": lo[ok], "temp_c": np.round(vals[ok], 2)})
+
+
+def point_table(lat0, lon0, data_dir=era5_data.DATA_DIR):
+    """
+    最近邻格点的 Annual + 12 个月逐年序列（宽表：year, annual, month01..month12）。
+    一共 13 条一维序列，数据量很小。
+    """
+    columns = {}
+    nearest = None
+    for mode in all_modes():
+        path = file_for_mode(mode, 0, data_dir)
+        if not path.exists():
+            continue
+        lat, lon = era5_data.read_coords(path)
+        i, j = era5_data.nearest_index(lat, lon, lat0, lon0)
+        nearest = (float(lat[i]), float(era5_data.wrap_lon(lon[j])))
+        years, temps = era5_data.read_point_series(path, i, j)
+        columns[_mode_label(mode)] = pd.Series(np.round(temps, 2), index=years)
+    df = pd.DataFrame(columns)
+    df.index.name = "year"
+    return df.reset_index(), nearest
+
+
+def _bbox_indices(lat, lon, bbox):
+    """bbox=(south, north, west, east)，经度 -180..180，west > east 表示跨日界线。"""
+    south, north, west, east = map(float, bbox)
+    rows = np.flatnonzero((lat >= min(south, north)) & (lat <= max(south, north)))
+    lon_fixed = era5_data.wrap_lon(lon)
+    if west <= east:
+        sel = (lon_fixed >= west) & (lon_fixed <= east)
+    else:
+        sel = (lon_fixed >= west) | (lon_fixed <= east)
+    cols = np.flatnonzero(sel)
+    # 跨日界线时从 west 开始连续排列
+    cols = cols[np.argsort((lon_fixed[cols] - west) % 360, kind="stable")]
+    return rows, cols, lon_fixed[cols]
+
+
+def iter_cube_slabs(mode, bbox, year_start, year_end, data_dir=era5_data.DATA_DIR):
+    """
+    逐个时间步 yield (timestamp, lat, lon, values_c)，每次只读一个 (lat, lon) 切片。
+    """
+    path = file_for_mode(mode, 0, data_dir)
+    with era5_data.POOL.open(path) as ds:
+        times = pd.to_datetime(ds["valid_time"].values)
+        lat = ds["latitude"].values
+        lon = ds["longitude"].values
+    rows, cols, lon_out = _bbox_indices(lat, lon, bbox)
+    if len(rows) == 0 or len(cols) == 0:
+        return
+    steps = np.flatnonzero((times.year >= int(year_start)) & (times.year <= int(year_end)))
+    for k in steps:
+        # 每一步单独拿锁：导出很大时也不会长时间挡住其他 session 的读取
+        with era5_data.POOL.open(path) as ds:
+            slab = ds["t2m"].isel(valid_time=int(k), latitude=rows, longitude=cols).values
+        yield times[k], lat[rows], lon_out, era5_data.k_to_c(slab).astype(np.float32)
+
+
+# ----------------------------
+# 编码
+# ----------------------------
+def iter_csv(blocks):
+    """DataFrame 块 -> CSV 字节块（只在第一块写表头）。"""
+    header = True
+    for df in blocks:
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=header)
+        header = False
+        yield buf.getvalue().encode("utf-8")
+
+
+def _cube_blocks(slabs):
+    for t, lat, lon, vals in slabs:
+        for df in iter_field_blocks(lat, lon, vals):
+            df.insert(0, "time", t.strftime("%Y-%m-%d"))
+            yield df
+
+
+def _stream_file(path, chunk_bytes=FILE_CHUNK_BYTES):
+    """分块读出临时文件，读完删除。"""
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_bytes), b""):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def _temp_path(suffix):
+    fd, path = tempfile.mkstemp(prefix="gw_export_", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def _write_parquet(blocks, path):
+    if not parquet_available():
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for df in blocks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _write_cube_netcdf(slabs, path, mode):
+    """逐时间步追加写 NetCDF（valid_time 为 unlimited 维度）。"""
+    import netCDF4
+
+    with netCDF4.Dataset(path, "w") as nc:
+        var = None
+        for k, (t, lat, lon, vals) in enumerate(slabs):
+            if var is None:
+                nc.createDimension("valid_time", None)
+                nc.createDimension("latitude", len(lat))
+                nc.createDimension("longitude", len(lon))
+                tv = nc.createVariable("valid_time", "i8", ("valid_time",))
+                tv.units = "days since 1900-01-01"
+                tv.calendar = "proleptic_gregorian"
+                nc.createVariable("latitude", "f8", ("latitude",))[:] = lat
+                nc.createVariable("longitude", "f8", ("longitude",))[:] = lon
+                nc["latitude"].units = "degrees_north"
+                nc["longitude"].units = "degrees_east"
+                var = nc.createVariable(
+                    "t2m_c",
+                    "f4",
+                    ("valid_time", "latitude", "longitude"),
+                    zlib=True,
+                    chunksizes=(1, len(lat), len(lon)),
+                    fill_value=np.float32(np.nan),
+                )
+                var.units = "degC"
+                var.long_name = "2 metre temperature"
+                nc.source = f"ERA5 t2m ({'Annual mean' if mode == 'Annual' else f'month {int(mode):02d}'})"
+            nc["valid_time"][k] = (t - pd.Timestamp("1900-01-01")).days
+            var[k] = vals
+
+
+def export_field(mode, year, fmt="csv", level=0):
+    """某一帧的完整气温场（默认原始分辨率）。"""
+    lat, lon, temp_c = era5_data.read_year_field(file_for_mode(mode, level), year)
+    return _export_table(
+        lambda: iter_field_blocks(lat, lon, temp_c),
+        fmt,
+        field_stem(mode, year),
+        netcdf=lambda p: _write_field_netcdf(lat, lon, temp_c, p, mode, year),
+    )
+
+
+def _write_field_netcdf(lat, lon, temp_c, path, mode, year):
+    import xarray as xr
+
+    da = xr.DataArray(temp_c, coords={"latitude": lat, "longitude": lon}, dims=("latitude", "longitude"), name="t2m_c")
+    da.attrs.update(units="degC", long_name="2 metre temperature")
+    da.to_dataset().assign_attrs(mode=str(mode), year=int(year)).to_netcdf(path)
+
+
+def export_point(lat0, lon0, fmt="csv"):
+    """最近邻格点的全部 13 条序列。"""
+    df, nearest = point_table(lat0, lon0)
+    stem = point_stem(*nearest) if nearest else "t2m_point"
+    return _export_table(lambda: iter([df]), fmt, stem, netcdf=lambda p: df.set_index("year").to_xarray().to_netcdf(p))
+
+
+def export_cube(mode, bbox, year_start, year_end, fmt="csv"):
+    """某个 mode 在 bbox 和年份范围内的所有时间步。"""
+    # 数据是边读边发的：缺文件要在开始发送之前报出来
+    file_for_mode(mode).stat()
+
+    def slabs():
+        # 每次调用返回新的迭代器：真正开始发送时才读文件
+        return iter_cube_slabs(mode, bbox, year_start, year_end)
+
+    return _export_table(lambda: _cube_blocks(slabs()), fmt, cube_stem(mode, year_start, year_end), netcdf=lambda p: _write_cube_netcdf(slabs(), p, mode))
+
+
+def _export_table(blocks, fmt, stem, netcdf):
+    """-> (content_type, file_name, 字节块迭代器)。"""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    content_type, ext = FORMATS[fmt]
+    name = file_name(stem, fmt)
+
+    if fmt == "csv":
+        return content_type, name, iter_csv(blocks())
+
+    def generate():
+        path = _temp_path(f".{ext}")
+        try:
+            if fmt == "parquet":
+                _write_parquet(blocks(), path)
+            else:
+                netcdf(path)
+        except BaseException:
+            os.unlink(path)
+            raise
+        yield from _stream_file(path)
+
+    if fmt == "parquet" and not parquet_available():
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    return content_type, name, generate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export ERA5 temperature data")
+    sub = parser.add_subparsers(dest="kind", required=True)
+
+    p = sub.add_parser("field")
+    p.add_argument("--mode", required=True)
+    p.add_argument("--year", type=int, required=True)
+
+    p = sub.add_parser("point")
+    p.add_argument("--lat", type=float, required=True)
+    p.add_argument("--lon", type=float, required=True)
+
+    p = sub.add_parser("cube")
+    p.add_argument("--mode", required=True)
+    p.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "NORTH", "WEST", "EAST"), default=(-90, 90, -180, 180))
+    p.add_argument("--years", type=int, nargs=2, metavar=("START", "END"), required=True)
+
+    for p in sub.choices.values():
+        p.add_argument("--format", choices=list(FORMATS), default="csv")
+        p.add_argument("-o", "--output", help="output file (default: stdout)")
+
+    args = parser.parse_args(argv)
+    if args.kind == "field":
+        _, _, chunks = export_field(parse_mode(args.mode), args.year, args.format)
+    elif args.kind == "point":
+        _, _, chunks = export_point(args.lat, args.lon, args.format)
+    else:
+        _, _, chunks = export_cube(parse_mode(args.mode), args.bbox, *args.years, fmt=args.format)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+            print(f"wrote {Path(args.output).resolve()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+把新到的 ERA5 月份增量并入 ERA5_monthly/：不重新处理整个数据集，不清缓存，也不用重启。
+
+    python ingest.py [--data-dir ERA5_monthly] new_month.nc [more.nc ...] [--dry-run]
+
+输入是 CDS 下载的月平均 2 m 气温：t2m(valid_time, latitude, longitude)，单位 K，网格与现有文件相同；
+一个文件里可以有一个或多个月。对每个 (年, 月)：
+
+1. 月文件：新的年份插进时间轴（通常在末尾），已有的年份（比如 ERA5T 修订成 ERA5）只替换这一个时间片；
+   内容完全相同的时间片直接跳过，重复导入同一个文件什么也不改
+2. 年平均文件：受影响的年份 12 个月都齐了时，重新求这一年的平均，其他年份不动
+3. 金字塔（pyramid/level_k）：只把变化的时间片逐级粗化后写进去
+4. manifest.json：更新这些文件的 stat / sha256 / 年份范围，只有变化的年份换 year_versions
+
+写文件：HDF5 不支持一边写一边被其他进程读，所以每个文件都流式复制到临时文件，复制时插入 / 替换时间片，
+再 os.replace 原子替换——读者要么看到旧文件，要么看到新文件；已打开的旧句柄由 DatasetPool 按 inode 发现后重开。
+压缩、分块和属性都沿用原文件，时间维改成 unlimited。
+
+整个过程持有 manifest 的重建锁：worker 中途发现文件变了只会等着，之后拿到的是这里写好的 manifest，
+而不会自己全量重建（那样所有年份的版本都会变，缓存全部失效）。
+
+缓存：页面 / 瓦片服务 / 静态站点的单帧缓存 key 带 manifest.year_version(mode, year)，只有变化的 (mode, year)
+换 key 重新解码；点击曲线、国家平均这类整条序列的缓存带 manifest.series_version(mode)，只有被修改的 mode 重新计算。
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import era5_data
+import manifest
+from era5_data import DATA_DIR, file_for_mode
+
+TIME_NAMES = ("valid_time", "time")
+
+
+def slice_version(field):
+    """一帧的内容版本：同样的数据重复导入，版本不变，缓存继续命中。"""
+    return hashlib.sha256(np.ascontiguousarray(field, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+
+def _dates(t_var):
+    import netCDF4
+
+    values = t_var[:]
+    if len(values) == 0:
+        return []
+    dates = netCDF4.num2date(
+        values,
+        t_var.units,
+        getattr(t_var, "calendar", "standard"),
+        only_use_cftime_datetimes=False,
+        only_use_python_datetimes=True,
+    )
+    return [datetime(d.year, d.month, d.day, d.hour, d.minute, d.second) for d in np.atleast_1d(dates)]
+
+
+def _grid(path):
+    import netCDF4
+
+    with netCDF4.Dataset(path) as ds:
+        return np.asarray(ds.variables["latitude"][:], dtype=np.float64), np.asarray(ds.variables["longitude"][:], dtype=np.float64)
+
+
+def read_input(path):
+    """新数据文件 -> ([(datetime, t2m(K, float32), {时间维上的其他变量: 值}), ...], lat, lon)。"""
+    import netCDF4
+
+    name = Path(path).name
+    with netCDF4.Dataset(path) as ds:
+        tname = next((n for n in TIME_NAMES if n in ds.variables), None)
+        if tname is None or "t2m" not in ds.variables:
+            raise ValueError(f"{name}: expected variables t2m and valid_time")
+        v = ds.variables["t2m"]
+        if v.dimensions != (tname, "latitude", "longitude"):
+            raise ValueError(f"{name}: t2m dims are {v.dimensions}, expected ({tname}, latitude, longitude)")
+        if getattr(v, "units", "K") != "K":
+            raise ValueError(f"{name}: t2m units are {v.units!r}, expected 'K'")
+        lat = np.asarray(ds.variables["latitude"][:], dtype=np.float64)
+        lon = np.asarray(ds.variables["longitude"][:], dtype=np.float64)
+        extra_vars = {n: var for n, var in ds.variables.items() if var.dimensions == (tname,) and n != tname}
+        slices = []
+        for k, when in enumerate(_dates(ds.variables[tname])):
+            field = np.ma.filled(np.ma.asarray(v[k], dtype=np.float32), np.nan)
+            slices.append((when, field, {n: var[k] for n, var in extra_vars.items()}))
+    return slices, lat, lon
+
+
+def read_slice(path, year):
+    """某个文件里某一年的 t2m（K）；没有这一年时返回 None。"""
+    import netCDF4
+
+    with netCDF4.Dataset(path) as ds:
+        for k, when in enumerate(_dates(ds.variables["valid_time"])):
+            if when.year == int(year):
+                return np.ma.filled(np.ma.asarray(ds.variables["t2m"][k], dtype=np.float32), np.nan)
+    return None
+
+
+def _create_like(dst, var):
+    """按原变量的类型、压缩、分块和属性建新变量。"""
+    kwargs = {}
+    if var.dtype is not str:
+        filters = var.filters() or {}
+        if filters.get("zlib"):
+            kwargs.update(zlib=True, complevel=filters.get("complevel") or 4, shuffle=bool(filters.get("shuffle")))
+        chunking = var.chunking()
+        if chunking not in (None, "contiguous"):
+            kwargs["chunksizes"] = chunking
+        if "_FillValue" in var.ncattrs():
+            kwargs["fill_value"] = var.getncattr("_FillValue")
+    out = dst.createVariable(var.name, var.dtype, var.dimensions, **kwargs)
+    out.setncatts({k: var.getncattr(k) for k in var.ncattrs() if k != "_FillValue"})
+    return out
+
+
+def upsert(path, updates, note="ingest"):
+    """
+    updates: {year: (datetime, field, extras)}：已有的年份替换该时间片，新年份按时间顺序插入。
+    复制到临时文件再原子替换。返回 (新增的年份, 替换的年份)。
+    """
+    import netCDF4
+
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with netCDF4.Dataset(path) as src:
+        t_src = src.variables["valid_time"]
+        units, calendar = t_src.units, getattr(t_src, "calendar", "standard")
+        rows = {}
+        for k, when in enumerate(_dates(t_src)):
+            if when.year in rows:
+                raise ValueError(f"{path.name}: more than one time step in {when.year}")
+            rows[when.year] = k
+        appended = sorted(y for y in updates if y not in rows)
+        replaced = sorted(y for y in updates if y in rows)
+        # 输出的时间轴：(年份, 原文件下标 或 None 表示新数据)
+        order = sorted({**rows, **{y: None for y in updates}}.items())
+        time_vars = [name for name, var in src.variables.items() if var.dimensions[:1] == ("valid_time",)]
+
+        with netCDF4.Dataset(tmp, "w", format=src.data_model) as dst:
+            dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+            dst.history = f"{stamp} {note}\n" + str(getattr(src, "history", ""))
+            for name, dim in src.dimensions.items():
+                dst.createDimension(name, None if name == "valid_time" else len(dim))
+            for name, var in src.variables.items():
+                out = _create_like(dst, var)
+                if name in time_vars:
+                    continue
+                if var.dimensions == ():
+                    out.assignValue(var.getValue())
+                else:
+                    out[:] = var[:]
+
+            # 原文件里连续的一段整块复制，新时间片逐个写
+            k = 0
+            while k < len(order):
+                year, row = order[k]
+                if row is None:
+                    when, field, extras = updates[year]
+                    for name in time_vars:
+                        out = dst.variables[name]
+                        if name == "valid_time":
+                            out[k] = np.asarray(netCDF4.date2num(when, units, calendar)).astype(out.dtype)
+                        elif name == "t2m":
+                            out[k] = field
+                        elif name in extras:
+                            out[k] = extras[name]
+                        elif rows:
+                            # 新数据里没有的辅助变量（如 expver）：沿用原文件最后一个时间步的值
+                            out[k] = src.variables[name][max(rows.values())]
+                    k += 1
+                    continue
+                end = k + 1
+                while end < len(order) and order[end][1] is not None and order[end][1] == order[end - 1][1] + 1:
+                    end += 1
+                for name in time_vars:
+                    dst.variables[name][k:end] = src.variables[name][row : row + end - k]
+                k = end
+    os.replace(tmp, path)
+    return appended, replaced
+
+
+def annual_field(data_dir, year):
+    """12 个月都有这一年时返回月平均（K），否则返回 (None, 缺的月份)。"""
+    fields, missing = [], []
+    for month in range(1, 13):
+        field = read_slice(file_for_mode(month, 0, data_dir), year)
+        if field is None:
+            missing.append(month)
+        else:
+            fields.append(field)
+    if missing:
+        return None, missing
+    return np.mean(fields, axis=0).astype(np.float32), []
+
+
+def _annual_time(path, year):
+    """年平均文件里这一年的时间戳：沿用文件已有的月 / 日约定（比如每年 1 月 1 日）。"""
+    import netCDF4
+
+    with netCDF4.Dataset(path) as ds:
+        dates = _dates(ds.variables["valid_time"])
+    last = dates[-1] if dates else datetime(int(year), 1, 1)
+    return last.replace(year=int(year))
+
+
+def _same(a, b):
+    return b is not None and a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+
+
+def _write_mode(data_dir, mode, updates, levels, note, log):
+    """写一个 mode 的原始文件和各金字塔层；返回 {年份: 版本}。"""
+    key = manifest.mode_key(mode)
+    appended, replaced = upsert(file_for_mode(mode, 0, data_dir), updates, note)
+    log(f"{key:>6}: appended {appended or '-'}, replaced {replaced or '-'}")
+    coarse = {year: (when, field, extras) for year, (when, field, extras) in updates.items()}
+    for level, _ in levels:
+        if level == 0:
+            continue
+        coarse = {year: (when, era5_data.coarsen2(field[None])[0], extras) for year, (when, field, extras) in coarse.items()}
+        path = file_for_mode(mode, level, data_dir)
+        if path.exists():
+            upsert(path, coarse, note)
+    return {year: slice_version(field) for year, (_, field, _) in updates.items()}
+
+
+def ingest(inputs, data_dir=DATA_DIR, dry_run=False, log=print):
+    """
+    把 inputs 里的月份并入 data_dir；返回 {mode_key: {年份: 新版本}}（dry_run 时是将要写的内容）。
+    """
+    data_dir = Path(data_dir)
+    # 按 (月, 年) 收集；同一个月出现多次时以后面的输入为准
+    monthly = {}
+    for path in inputs:
+        slices, lat, lon = read_input(path)
+        for when, field, extras in slices:
+            target = file_for_mode(when.month, 0, data_dir)
+            if not target.exists():
+                raise FileNotFoundError(f"{target} does not exist; ingest only extends existing files")
+            ref_lat, ref_lon = _grid(target)
+            if ref_lat.shape != lat.shape or ref_lon.shape != lon.shape or not (np.allclose(ref_lat, lat) and np.allclose(ref_lon, lon)):
+                raise ValueError(f"{Path(path).name}: grid {len(lat)}x{len(lon)} does not match {target.name} ({len(ref_lat)}x{len(ref_lon)})")
+            monthly.setdefault(when.month, {})[when.year] = (when, field, extras)
+
+    manifest.load_or_rebuild(data_dir)
+    with manifest.rebuild_lock(data_dir):
+        previous = manifest.read_manifest(data_dir)
+        if manifest.is_stale(previous, data_dir):
+            previous = manifest.build_manifest(data_dir, previous=previous)
+
+        # 内容没变的时间片不写
+        for month, updates in monthly.items():
+            path = file_for_mode(month, 0, data_dir)
+            for year in [y for y, (_, field, _) in updates.items() if _same(field, read_slice(path, y))]:
+                log(f"{manifest.mode_key(month):>6}: {year} unchanged")
+                del updates[year]
+        monthly = {m: u for m, u in monthly.items() if u}
+        if not monthly:
+            log("nothing to do")
+            return {}
+
+        plan = {manifest.mode_key(m): {y: slice_version(f) for y, (_, f, _) in u.items()} for m, u in monthly.items()}
+        if dry_run:
+            for key, versions in sorted(plan.items()):
+                log(f"{key:>6}: would write {sorted(versions)}")
+            return plan
+
+        note = "ingest.py: " + ", ".join(f"{y}-{m:02d}" for m, u in sorted(monthly.items()) for y in sorted(u))
+        levels = era5_data.read_pyramid_levels(data_dir)
+        versions = {}
+        for month, updates in sorted(monthly.items()):
+            versions[manifest.mode_key(month)] = _write_mode(data_dir, month, updates, levels, note, log)
+
+        # 年平均：只重算受影响、且 12 个月都齐了的年份
+        annual_path = file_for_mode("Annual", 0, data_dir)
+        years = sorted({y for u in monthly.values() for y in u})
+        if annual_path.exists():
+            annual = {}
+            for year in years:
+                field, missing = annual_field(data_dir, year)
+                if field is None:
+                    log(f"Annual: {year} still missing months {missing}; annual mean not updated")
+                elif not _same(field, read_slice(annual_path, year)):
+                    annual[year] = (_annual_time(annual_path, year), field, {})
+            if annual:
+                versions["Annual"] = _write_mode(data_dir, "Annual", annual, levels, note, log)
+        else:
+            log(f"no {annual_path.name}; annual mean not updated")
+
+        # manifest：重新 stat / 校验改过的文件，未变化年份的版本原样保留
+        updated = manifest.build_manifest(data_dir, previous=previous)
+        for key, changed in versions.items():
+            entry = updated["files"][key]
+            old = previous["files"].get(key) or {}
+            kept = {}
+            if old.get("years"):
+                kept = {str(y): manifest.year_version(previous, key, y) for y in range(old["years"][0], old["years"][1] + 1)}
+            entry["year_versions"] = {**kept, **{str(y): v for y, v in changed.items()}}
+        manifest.write_manifest(updated, data_dir)
+    return versions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append or replace ERA5 months in place, updating only what changed")
+    parser.add_argument("inputs", nargs="+", help="NetCDF files with t2m for one or more months")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args(argv)
+
+    try:
+        versions = ingest(args.inputs, args.data_dir, dry_run=args.dry_run)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    n = sum(len(v) for v in versions.values())
+    print(f"{'would update' if args.dry_run else 'updated'} {n} (mode, year) frames in {len(versions)} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
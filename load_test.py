@@ -0,0 +1,300 @@
+"""
+本地压测：在一个进程里用 AppTest 模拟很多个同时在线的 session，估计一个 worker 能扛多少人。
+
+    python load_test.py [--sessions 20] [--concurrency 8] [--steps 15] [--quiz-share 0.3] [--think 10]
+    python load_test.py --synthetic [--data-dir /tmp/gw_load] [--years 1940 2024]
+
+不需要网络和浏览器：AppTest 直接在本进程里跑页面脚本，st.cache_* / 共享缓存 / 线程池都和真实 worker 一样，
+每个模拟用户有自己的 session_state。
+
+AppTest 每次 run 都会临时替换进程级的全局对象（Runtime 实例、config.get_option），多个线程同时 run
+会互相踩坏（缓存失效、控件状态串台），所以这里不用线程并发：同时在线的 concurrency 个 session
+轮流各跑一步（交错执行），每次只有一个 rerun 在跑。测到的 rerun 耗时就是服务时间，
+按“每个用户平均每 think 秒操作一次”折算出一个 worker 能同时服务的用户数 ≈ 吞吐 × think。
+- 地图用户：打开页面，然后随机拖年份滑块、切换月份、在地图上点格子
+  （点击走 st_deckgl 的返回值：把 {"coordinate": [lon, lat]} 写进它的 key "main_deck"，和前端发来的事件一样）
+- 测验用户：开始 5 / 10 / 15 题的测验，逐题选答案、确认、下一题
+- 所有 session 跑完后都不释放（模拟一直开着页面的用户），以此估计每个 session 的内存增长；
+  这个增长偏保守：里面还包括新访问到的 (mode, year) 进入缓存，以及 AppTest 为每个 session 留着的元素树
+
+报告：每类操作 rerun 耗时的 p50 / p95 / max（AppTest 端到端，含脚本执行和元素序列化）、
+总吞吐（rerun/s）和折算的同时在线用户数，以及预热后每多一个 session 增加的 RSS。
+
+--synthetic 生成与 ERA5_monthly 同结构的合成数据（13 个 NetCDF），不需要真实数据；
+答题记录默认写到临时数据库（GW_QUIZ_DB），不会混进老师看的统计。
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent
+MAP_SCRIPT = APP_DIR / "Map_Interactive.py"
+QUIZ_SCRIPT = APP_DIR / "pages" / "Climate_Quiz.py"
+MONTH_OPTIONS = ["Annual"] + [f"{m:02d}" for m in range(1, 13)]
+
+
+def make_synthetic(data_dir, first_year=1940, last_year=2024, res=2.0, seed=0):
+    """写 12 个月 + 年平均文件：纬向分布 + 季节循环 + 线性增暖 + 噪声（K），坐标约定与 ERA5 一致。"""
+    import pandas as pd
+    import xarray as xr
+
+    import era5_data
+
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    lat = np.arange(90 - res / 2, -90, -res)
+    lon = np.arange(res / 2, 360, res)
+    years = np.arange(first_year, last_year + 1)
+    base = 300.0 - 45.0 * np.sin(np.deg2rad(lat))[:, None] ** 2
+    trend = 0.015 * (years - first_year)
+
+    monthly = []
+    for month in range(1, 13):
+        season = -12.0 * np.cos(2 * np.pi * (month - 1) / 12) * np.sin(np.deg2rad(lat))[:, None]
+        t2m = base[None] + season[None] + trend[:, None, None] + rng.normal(0, 1.0, (len(years), len(lat), len(lon)))
+        t2m = t2m.astype(np.float32)
+        monthly.append(t2m)
+        times = pd.to_datetime([f"{y}-{month:02d}-01" for y in years])
+        _write(xr, t2m, times, lat, lon, data_dir / era5_data.file_name_for_mode(month))
+    annual = np.mean(monthly, axis=0).astype(np.float32)
+    _write(xr, annual, pd.to_datetime([f"{y}-01-01" for y in years]), lat, lon, data_dir / era5_data.ANNUAL_FILE)
+    return data_dir
+
+
+def _write(xr, t2m, times, lat, lon, path):
+    ds = xr.Dataset(
+        {"t2m": (("valid_time", "latitude", "longitude"), t2m, {"units": "K"})},
+        coords={"valid_time": times, "latitude": lat, "longitude": lon},
+    )
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    ds.to_netcdf(tmp)
+    os.replace(tmp, path)
+
+
+class Recorder:
+    """所有 session 共用：(页面, 操作) -> [秒, ...]，外加页面异常。"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = []
+
+    def run(self, at, page, action):
+        t0 = time.perf_counter()
+        at.run()
+        self.timings[(page, action)].append(time.perf_counter() - t0)
+        self.errors.extend(f"{page}/{action}: {e.message}" for e in at.exception)
+        return at
+
+
+def _by_label(elements, label):
+    return next(e for e in elements if e.label == label)
+
+
+# 每个模拟用户是一个生成器：每跑完一次 rerun 就 yield，让出给下一个 session；结束时返回它的 AppTest
+def map_session(rec, steps, rng):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(MAP_SCRIPT), default_timeout=300)
+    rec.run(at, "map", "open")
+    yield
+    for _ in range(steps):
+        if at.exception:
+            break
+        action = rng.choices(("year", "month", "click"), weights=(6, 2, 2))[0]
+        if action == "year":
+            slider = _by_label(at.slider, "Select a year")
+            slider.set_value(rng.randint(slider.min, slider.max))
+        elif action == "month":
+            _by_label(at.selectbox, "Select a month (or annual mean)").set_value(rng.choice(MONTH_OPTIONS))
+        else:
+            at.session_state["main_deck"] = {"coordinate": [rng.uniform(-180, 180), rng.uniform(-60, 75)]}
+        rec.run(at, "map", action)
+        yield
+    return at
+
+
+def quiz_session(rec, rng):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(QUIZ_SCRIPT), default_timeout=120)
+    rec.run(at, "quiz", "open")
+    yield
+    at.sidebar.radio[0].set_value(rng.choice([5, 10, 15]))
+    _by_label(at.sidebar.button, "Start Quiz").click()
+    rec.run(at, "quiz", "start")
+    yield
+    while not at.exception and at.session_state.idx < len(at.session_state.quiz_ids):
+        options = at.main.radio[0].options
+        at.main.radio[0].set_value(rng.choice(options))
+        rec.run(at, "quiz", "select")
+        yield
+        _by_label(at.main.button, "✅ Confirm").click()
+        rec.run(at, "quiz", "confirm")
+        yield
+        _by_label(at.main.button, "➡️ Next").click()
+        rec.run(at, "quiz", "next")
+        yield
+    return at
+
+
+def drive(sessions, concurrency):
+    """同时保持 concurrency 个 session 在线，轮流各推进一步；每结束一个返回它的 AppTest。"""
+    pending = iter(sessions)
+    active = []
+    while True:
+        while len(active) < concurrency:
+            gen = next(pending, None)
+            if gen is None:
+                break
+            active.append(gen)
+        if not active:
+            return
+        for gen in list(active):
+            try:
+                next(gen)
+            except StopIteration as stop:
+                active.remove(gen)
+                yield stop.value
+
+
+def _finish(gen):
+    for at in drive([gen], 1):
+        return at
+
+
+def rss_mb():
+    import memory_report
+
+    gc.collect()
+    rss = memory_report.process_rss_bytes()
+    return rss / 1024 / 1024 if rss else float("nan")
+
+
+def run_load(sessions=20, concurrency=8, steps=15, quiz_share=0.3, seed=0, think=10.0, log=print):
+    """预热一个地图 session 和一个测验 session（填满缓存），再交错跑 sessions 个；返回报告 dict。"""
+    rec = Recorder()
+    rng = random.Random(seed)
+    rss_start = rss_mb()
+    alive = [_finish(map_session(rec, 2, random.Random(seed))), _finish(quiz_session(rec, random.Random(seed)))]
+    rss_warm = rss_mb()
+    log(f"warm-up done: RSS {rss_start:.0f} -> {rss_warm:.0f} MB")
+    warm_timings = {k: list(v) for k, v in rec.timings.items()}
+    rec.timings.clear()
+
+    kinds = ["quiz" if rng.random() < quiz_share else "map" for _ in range(sessions)]
+    seeds = [rng.randrange(1 << 30) for _ in range(sessions)]
+
+    users = (
+        quiz_session(rec, random.Random(s)) if kind == "quiz" else map_session(rec, steps, random.Random(s))
+        for kind, s in zip(kinds, seeds)
+    )
+
+    t0 = time.perf_counter()
+    for k, at in enumerate(drive(users, concurrency), 1):
+        alive.append(at)
+        if k % max(1, sessions // 5) == 0 or k == sessions:
+            log(f"  {k}/{sessions} sessions done, RSS {rss_mb():.0f} MB")
+    wall = time.perf_counter() - t0
+    # alive 里的 session 都还没释放：这时的 RSS 才是“所有人都开着页面”的内存
+    rss_end = rss_mb()
+
+    all_runs = [s for v in rec.timings.values() for s in v]
+    # 只算跑脚本的时间（不含上面记 RSS 的开销）
+    busy = sum(all_runs)
+    return {
+        "sessions": sessions,
+        "map_sessions": kinds.count("map"),
+        "quiz_sessions": kinds.count("quiz"),
+        "concurrency": concurrency,
+        "wall_s": wall,
+        "reruns": len(all_runs),
+        "reruns_per_s": len(all_runs) / busy if busy > 0 else float("nan"),
+        "sessions_per_min": sessions / busy * 60 if busy > 0 else float("nan"),
+        "think_s": think,
+        "users_per_worker": len(all_runs) / busy * think if busy > 0 else float("nan"),
+        "latency": {f"{page}/{action}": _summary(v) for (page, action), v in sorted(rec.timings.items())},
+        "latency_all": _summary(all_runs),
+        "warmup": {f"{page}/{action}": _summary(v) for (page, action), v in sorted(warm_timings.items())},
+        "rss_mb": {"start": rss_start, "warm": rss_warm, "end": rss_end},
+        "rss_per_session_mb": (rss_end - rss_warm) / sessions if sessions else float("nan"),
+        "errors": rec.errors,
+    }
+
+
+def _summary(values):
+    if not values:
+        return {"n": 0}
+    a = np.asarray(values) * 1000
+    return {"n": len(a), "p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95)), "max_ms": float(a.max())}
+
+
+def print_report(report):
+    print(
+        f"\n{report['sessions']} sessions ({report['map_sessions']} map, {report['quiz_sessions']} quiz), "
+        f"{report['concurrency']} open at a time: {report['reruns']} reruns in {report['wall_s']:.1f} s; "
+        f"{report['reruns_per_s']:.1f} reruns/s, {report['sessions_per_min']:.1f} sessions/min"
+    )
+    print(
+        f"one worker holds about {report['users_per_worker']:.0f} active users "
+        f"if each interacts once every {report['think_s']:g} s"
+    )
+    print(f"{'rerun':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    rows = list(report["latency"].items()) + [("all", report["latency_all"])]
+    for name, s in rows:
+        if s["n"]:
+            print(f"{name:<16}{s['n']:>6}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    rss = report["rss_mb"]
+    print(
+        f"RSS: {rss['start']:.0f} MB at start, {rss['warm']:.0f} MB after warm-up, {rss['end']:.0f} MB with all sessions open "
+        f"({report['rss_per_session_mb']:.2f} MB per session)"
+    )
+    if report["errors"]:
+        print(f"{len(report['errors'])} page exceptions, first: {report['errors'][0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many concurrent sessions against one in-process worker")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions open at the same time (interleaved)")
+    parser.add_argument("--steps", type=int, default=15, help="interactions per map session after opening it")
+    parser.add_argument("--quiz-share", type=float, default=0.3, help="fraction of sessions that take the quiz")
+    parser.add_argument("--think", type=float, default=10.0, help="assumed seconds between a user's interactions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="sets GW_DATA_DIR (with --synthetic: where to generate the data)")
+    parser.add_argument("--synthetic", action="store_true", help="generate synthetic ERA5-like files first")
+    parser.add_argument("--years", type=int, nargs=2, default=(1940, 2024), metavar=("FIRST", "LAST"))
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # 必须在第一次 import era5_data 之前设好：DATA_DIR 在导入时读取
+    if args.synthetic:
+        data_dir = Path(args.data_dir or tempfile.mkdtemp(prefix="gw_load_")).resolve()
+        os.environ["GW_DATA_DIR"] = str(data_dir)
+        if not any(data_dir.glob("t2m_*.nc")):
+            print(f"writing synthetic data for {args.years[0]}-{args.years[1]} to {data_dir}")
+            make_synthetic(data_dir, *args.years, seed=args.seed)
+    elif args.data_dir:
+        os.environ["GW_DATA_DIR"] = str(Path(args.data_dir).resolve())
+    os.environ.setdefault("GW_QUIZ_DB", str(Path(tempfile.gettempdir()) / f"gw_load_quiz_{os.getpid()}.sqlite"))
+    # 页面脚本里 import 本目录的模块
+    sys.path.insert(0, str(APP_DIR))
+
+    report = run_load(args.sessions, args.concurrency, args.steps, args.quiz_share, args.seed, args.think)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
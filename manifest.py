@@ -0,0 +1,291 @@
+"""
+ERA5_monthly/ 的数据清单（manifest.json）。
+
+    python manifest.py [--data-dir ERA5_monthly] [--check]
+
+校验每个 mode（Annual + 12 个月）的文件：变量/坐标是否齐全、时间轴是否单调、
+网格是否一致；记录每个文件覆盖的年份、网格大小、坐标范围、sha256、mtime 和大小。
+
+页面启动和每次 rerun 只读这个小文件（外加对 13 个文件各做一次 os.stat 判断是否过期），
+不再为了给滑块取年份范围去打开 NetCDF。数据文件有变化时 load_or_rebuild() 会自动重建；
+未变化文件的 checksum 直接沿用上一版，不重新计算。
+
+每个文件还可以带 year_versions {年份: 版本}：由 ingest.py 增量写入新月份时维护，只有内容变了的年份换版本。
+缓存 key 用 year_version() / frame_version()（单帧，后者用于金字塔层）和 series_version()（整条时间序列），追加一个月只让这几个 key 失效。
+文件被整个替换（不经过 ingest.py）时 year_versions 作废，所有年份退回用文件的 sha256。
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import era5_data
+from era5_data import DATA_DIR, all_modes, file_for_mode, file_name_for_mode
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def mode_key(mode):
+    """manifest 里的 key："Annual" 或 "01".."12"。"""
+    return "Annual" if mode == "Annual" else f"{int(mode):02d}"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat_entry(path):
+    st_ = os.stat(path)
+    return {"mtime_ns": st_.st_mtime_ns, "size": st_.st_size}
+
+
+def describe_file(path):
+    """读坐标和时间轴（不读 t2m 数据），返回 (info, errors)。"""
+    errors = []
+    with era5_data.POOL.open(path) as ds:
+        for name in ("t2m", "valid_time", "latitude", "longitude"):
+            if name not in ds.variables:
+                errors.append(f"{path.name}: missing variable '{name}'")
+        if errors:
+            return {}, errors
+
+        times = pd.to_datetime(ds["valid_time"].values)
+        lat = ds["latitude"].values
+        lon = ds["longitude"].values
+        dims = tuple(ds["t2m"].dims)
+
+    if dims != ("valid_time", "latitude", "longitude"):
+        errors.append(f"{path.name}: t2m dims are {dims}, expected (valid_time, latitude, longitude)")
+    if len(times) == 0:
+        errors.append(f"{path.name}: empty valid_time axis")
+    elif not times.is_monotonic_increasing:
+        errors.append(f"{path.name}: valid_time is not sorted")
+
+    years = np.unique(times.year) if len(times) else np.array([], dtype=int)
+    res = float(np.median(np.abs(np.diff(lon)))) if len(lon) > 1 else 360.0
+    info = {
+        "n_times": int(len(times)),
+        "years": [int(years.min()), int(years.max())] if len(years) else None,
+        "n_years": int(len(years)),
+        "grid": {
+            "nlat": int(len(lat)),
+            "nlon": int(len(lon)),
+            "res_deg": res,
+            "lat_range": [float(np.min(lat)), float(np.max(lat))],
+            "lon_range": [float(np.min(lon)), float(np.max(lon))],
+        },
+    }
+    return info, errors
+
+
+def build_manifest(data_dir=DATA_DIR, previous=None):
+    """
+    扫描 data_dir 生成 manifest（dict）。
+    previous：上一版 manifest；文件 mtime/size 没变时沿用它的 sha256。
+    """
+    data_dir = Path(data_dir)
+    prev_files = (previous or {}).get("files", {})
+    files, missing, errors = {}, [], []
+
+    for mode in all_modes():
+        key = mode_key(mode)
+        path = file_for_mode(mode, 0, data_dir)
+        if not path.exists():
+            missing.append(file_name_for_mode(mode))
+            continue
+
+        entry = {"file": path.name, **_stat_entry(path)}
+        prev = prev_files.get(key)
+        if prev and prev.get("mtime_ns") == entry["mtime_ns"] and prev.get("size") == entry["size"] and prev.get("sha256"):
+            entry["sha256"] = prev["sha256"]
+            if prev.get("year_versions"):
+                entry["year_versions"] = prev["year_versions"]
+        else:
+            entry["sha256"] = file_sha256(path)
+
+        try:
+            info, errs = describe_file(path)
+        except Exception as exc:  # 打不开的文件也记进 errors，而不是让整个 ingest 失败
+            info, errs = {}, [f"{path.name}: {exc}"]
+        entry.update(info)
+        errors.extend(errs)
+        files[key] = entry
+
+    grids = {json.dumps({k: v for k, v in f["grid"].items() if k in ("nlat", "nlon")}) for f in files.values() if "grid" in f}
+    if len(grids) > 1:
+        errors.append(f"inconsistent grid shapes across files: {sorted(grids)}")
+
+    return {
+        "version": MANIFEST_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "data_dir": str(data_dir),
+        "files": files,
+        "missing": missing,
+        "errors": errors,
+    }
+
+
+def manifest_path(data_dir=DATA_DIR):
+    return Path(data_dir) / MANIFEST_FILE
+
+
+def read_manifest(data_dir=DATA_DIR):
+    path = manifest_path(data_dir)
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(manifest, data_dir=DATA_DIR):
+    path = manifest_path(data_dir)
+    tmp = path.with_suffix(f".json.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def is_stale(manifest, data_dir=DATA_DIR):
+    """只用 os.stat 判断：有文件新增/消失/mtime 或大小变化就算过期。"""
+    if manifest is None:
+        return True
+    files = manifest.get("files", {})
+    for mode in all_modes():
+        key = mode_key(mode)
+        path = file_for_mode(mode, 0, data_dir)
+        try:
+            st_ = os.stat(path)
+        except FileNotFoundError:
+            if key in files:
+                return True
+            continue
+        entry = files.get(key)
+        if entry is None or entry["mtime_ns"] != st_.st_mtime_ns or entry["size"] != st_.st_size:
+            return True
+    return False
+
+
+@contextmanager
+def rebuild_lock(data_dir):
+    # 多个 worker 同时发现过期时只让一个去重建；ingest.py 改数据文件时也持有它
+    if fcntl is None:
+        yield
+        return
+    with open(Path(data_dir) / ".manifest.lock", "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# 数据目录只读、manifest 写不回去时，重建结果留在进程内：{data_dir: manifest}。
+# 它记录的 mtime/size 就是 is_stale 检查的那组 stat，文件没变就一直复用，不会每次 rerun 重新校验
+_IN_MEMORY = {}
+
+
+def load_or_rebuild(data_dir=DATA_DIR):
+    """读 manifest；不存在或过期时重建并写回。"""
+    manifest = read_manifest(data_dir)
+    if not is_stale(manifest, data_dir):
+        return manifest
+    cached = _IN_MEMORY.get(str(data_dir))
+    if cached is not None and not is_stale(cached, data_dir):
+        return cached
+    try:
+        with rebuild_lock(data_dir):
+            manifest = read_manifest(data_dir)
+            if is_stale(manifest, data_dir):
+                manifest = build_manifest(data_dir, previous=manifest)
+                write_manifest(manifest, data_dir)
+    except OSError:
+        # 数据目录只读（PermissionError / EROFS）：照样用新 manifest，只是写不回去；
+        # 上一版内存里的 manifest 也作为 previous，未变化文件的 sha256 不重新计算
+        manifest = build_manifest(data_dir, previous=cached or manifest)
+        _IN_MEMORY[str(data_dir)] = manifest
+    return manifest
+
+
+def years_for_mode(manifest, mode):
+    """(year_min, year_max)；manifest 里没有该文件时返回 None。"""
+    entry = manifest["files"].get(mode_key(mode))
+    return tuple(entry["years"]) if entry and entry.get("years") else None
+
+
+def year_version(manifest, mode, year):
+    """某个 (mode, year) 这一帧的数据版本（放进缓存 key）；没有记录时用文件的 sha256。"""
+    entry = manifest["files"].get(mode_key(mode))
+    if not entry:
+        return None
+    return entry.get("year_versions", {}).get(str(int(year))) or entry["sha256"][:16]
+
+
+def frame_version(manifest, mode, year, level=0):
+    """
+    某一层（金字塔）某一帧的版本。金字塔层由原始文件生成，内容跟着 year_version 走；
+    金字塔还没按新数据重建（比原始文件旧）时内容和 manifest 对不上，再带上该层文件自己的 mtime/size。
+    """
+    version = year_version(manifest, mode, year)
+    if level and version:
+        src = file_for_mode(mode, 0, manifest["data_dir"])
+        dst = file_for_mode(mode, level, manifest["data_dir"])
+        try:
+            st_ = os.stat(dst)
+        except FileNotFoundError:
+            # 这个 mode 没有这一层（choose_level 给了 mode 时不会选到）：读文件时再报错
+            return version + ":missing"
+        if st_.st_mtime < os.stat(src).st_mtime:
+            version += f":{st_.st_mtime_ns}-{st_.st_size}"
+    return version
+
+
+def series_version(manifest, mode):
+    """整个文件（所有年份）的数据版本：逐年序列类的缓存用这个。"""
+    entry = manifest["files"].get(mode_key(mode))
+    return entry["sha256"][:16] if entry else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate ERA5_monthly/ and write manifest.json")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--check", action="store_true", help="only validate; do not write the manifest")
+    args = parser.parse_args(argv)
+
+    previous = read_manifest(args.data_dir)
+    manifest = build_manifest(args.data_dir, previous=previous)
+    for key, entry in manifest["files"].items():
+        years = entry.get("years") or ["?", "?"]
+        grid = entry.get("grid", {})
+        print(f"{key:>6}  {entry['file']:<28} {years[0]}-{years[1]}  {grid.get('nlat')}x{grid.get('nlon')}  {entry['sha256'][:12]}")
+    for name in manifest["missing"]:
+        print(f"missing: {name}", file=sys.stderr)
+    for err in manifest["errors"]:
+        print(f"error: {err}", file=sys.stderr)
+
+    if not args.check:
+        write_manifest(manifest, args.data_dir)
+        print(f"wrote {manifest_path(args.data_dir)}")
+    return 1 if manifest["errors"] or manifest["missing"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+内存账本：把一个 worker 进程的内存按来源拆开统计。
+
+- st.cache_data：每个被缓存函数的条目数、总字节（缓存里存的是 pickle 后的字节串）
+- matplotlib：仍然挂在 pyplot 里没关掉的 figure 数量和画布大小
+- st.session_state：每个活跃 session 的 state 大小
+- 其他自定义缓存：通过 register_source() 登记
+
+Streamlit 没有公开“遍历所有 session / 缓存”的 API，这里用到的内部对象都包在 try 里，
+拿不到时对应部分返回空，不影响页面本身。
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger("gw.memory")
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def register_source(name, fn):
+    """
+    登记一个自定义内存来源。
+    fn() -> (entries, bytes)
+    """
+    with _sources_lock:
+        _sources[name] = fn
+
+
+def deep_sizeof(obj, _seen=None):
+    """
+    估算对象占用的字节数（递归；numpy/pandas 按实际缓冲区计算）。
+    只是估算：共享的对象只数一次。
+    """
+    if _seen is None:
+        _seen = set()
+    oid = id(obj)
+    if oid in _seen:
+        return 0
+    _seen.add(oid)
+
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int) and type(obj).__module__.startswith("numpy"):
+        return nbytes + sys.getsizeof(obj, 0) if obj.base is None else sys.getsizeof(obj, 0)
+
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and type(obj).__module__.startswith("pandas"):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+        except Exception:
+            pass
+
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_sizeof(k, _seen) + deep_sizeof(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += deep_sizeof(v, _seen)
+    return size
+
+
+def process_rss_bytes():
+    """当前进程常驻内存（Linux 读 /proc；其他平台退回到峰值 RSS）。"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+
+def cache_data_usage():
+    """每个 st.cache_data 函数：{name: {"entries": n, "bytes": b}}。"""
+    usage = {}
+    try:
+        from streamlit.runtime.caching.cache_data_api import get_data_cache_stats_provider
+
+        provider = get_data_cache_stats_provider()
+        # 按条目统计需要逐个 DataCache 取 stats（公开的 get_stats 会按函数合并掉条目数）
+        with provider._caches_lock:
+            caches = [c for per_func in provider._function_caches.values() for c in per_func.values()]
+        for cache in caches:
+            for stats in cache.get_stats().values():
+                for stat in stats:
+                    u = usage.setdefault(stat.cache_name, {"entries": 0, "bytes": 0})
+                    u["entries"] += 1
+                    u["bytes"] += stat.byte_length
+    except Exception as exc:
+        logger.debug("cache_data stats unavailable: %s", exc)
+    return usage
+
+
+def figure_usage():
+    """pyplot 里还没 close 的 figure（没关掉就一直占着内存）。"""
+    if "matplotlib.pyplot" not in sys.modules:
+        return {"open": 0, "bytes": 0}
+    from matplotlib._pylab_helpers import Gcf
+
+    total = 0
+    managers = Gcf.get_all_fig_managers()
+    for manager in managers:
+        w, h = manager.canvas.get_width_height()
+        total += w * h * 4  # Agg 画布 RGBA 缓冲区
+    return {"open": len(managers), "bytes": total}
+
+
+def session_usage():
+    """每个活跃 session 的 session_state 大小：[{"session": id, "keys": n, "bytes": b}]。"""
+    rows = []
+    try:
+        from streamlit.runtime import Runtime
+
+        if not Runtime.exists():
+            return rows
+        for info in Runtime.instance()._session_mgr.list_active_sessions():
+            state = info.session.session_state
+            values = {}
+            for key in list(state):
+                try:
+                    values[key] = state[key]
+                except Exception:
+                    continue
+            rows.append({"session": info.session.id, "keys": len(values), "bytes": deep_sizeof(values)})
+    except Exception as exc:
+        logger.debug("session stats unavailable: %s", exc)
+    return rows
+
+
+def custom_usage():
+    out = {}
+    with _sources_lock:
+        sources = dict(_sources)
+    for name, fn in sources.items():
+        try:
+            entries, nbytes = fn()
+            out[name] = {"entries": int(entries), "bytes": int(nbytes)}
+        except Exception as exc:
+            logger.debug("memory source %s failed: %s", name, exc)
+    return out
+
+
+def collect():
+    """完整报告（dict，可直接 json.dumps）。"""
+    caches = cache_data_usage()
+    figures = figure_usage()
+    sessions = session_usage()
+    custom = custom_usage()
+    return {
+        "time": time.time(),
+        "pid": os.getpid(),
+        "rss_bytes": process_rss_bytes(),
+        "cache_data": caches,
+        "cache_data_bytes": sum(c["bytes"] for c in caches.values()),
+        "figures": figures,
+        "sessions": sessions,
+        "session_state_bytes": sum(s["bytes"] for s in sessions),
+        "custom": custom,
+    }
+
+
+def summary_line(report):
+    """周期日志用的一行 JSON（不含逐 session 明细）。"""
+    return json.dumps(
+        {
+            "event": "memory",
+            "pid": report["pid"],
+            "rss_bytes": report["rss_bytes"],
+            "cache_data_bytes": report["cache_data_bytes"],
+            "cache_data_entries": sum(c["entries"] for c in report["cache_data"].values()),
+            "open_figures": report["figures"]["open"],
+            "sessions": len(report["sessions"]),
+            "session_state_bytes": report["session_state_bytes"],
+            "custom": report["custom"],
+        }
+    )
+
+
+_logger_thread = None
+_logger_lock = threading.Lock()
+
+
+def start_periodic_log(interval=None):
+    """
+    每个进程启动一次后台线程，每 interval 秒输出一行内存日志。
+    interval 默认读 GW_MEMORY_LOG_SECONDS（默认 300；设为 0 关闭）。
+    日志输出不了（GW_LOG_LEVEL=off 或级别高于 INFO）时不启动：collect() 要遍历所有 session，白算没有意义。
+    """
+    global _logger_thread
+    if interval is None:
+        interval = float(os.environ.get("GW_MEMORY_LOG_SECONDS", "300"))
+    if interval <= 0:
+        return None
+    metrics.configure_logging()
+    if not metrics.log_enabled(logger):
+        return None
+    with _logger_lock:
+        if _logger_thread is None:
+
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        logger.info(summary_line(collect()))
+                    except Exception:
+                        logger.exception("memory report failed")
+
+            _logger_thread = threading.Thread(target=loop, name="gw-memory-log", daemon=True)
+            _logger_thread.start()
+    return _logger_thread
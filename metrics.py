@@ -0,0 +1,250 @@
+"""
+轻量级运行指标：记录 Map_Interactive.py 每次 rerun 中各阶段的耗时、payload 字节数、缓存命中情况。
+
+用法（在脚本里）：
+    trace = metrics.RerunTrace()
+    with trace.stage("load_year_field", cached=True) as rec:
+        lat, lon, temp_c = load_year_field(mode, year)
+        rec["bytes"] = temp_c.nbytes
+    trace.finish()
+
+被 st.cache_data 包住的函数体内调用 metrics.mark_miss()：
+函数体只有在缓存未命中时才会执行，所以没被标记的 cached 阶段就是命中。
+
+进程级汇总可以输出成 Prometheus 文本格式；设置环境变量 GW_METRICS_PORT
+后会在本机起一个只读的 /metrics 端点，方便本地抓取。
+
+日志：Streamlit 不会配置 gw.* 这些 logger（导入 streamlit 后有效级别是 WARNING，root 也没有 handler），
+所以由 configure_logging() 给 "gw" 挂一个 stderr handler；级别读 GW_LOG_LEVEL（默认 INFO，设为 off 不挂）。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("gw.metrics")
+
+LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+_logging_lock = threading.Lock()
+_logging_configured = False
+
+_local = threading.local()
+
+
+def configure_logging(level=None):
+    """
+    每个进程一次：给 "gw" logger 挂 stderr handler 并设置级别，gw.* 的 INFO 日志（rerun 记录、内存日志）才会真正输出。
+    level 默认读 GW_LOG_LEVEL（默认 INFO；off 表示不配置）。"gw" 上已经有 handler 时不重复挂。
+    """
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        _logging_configured = True
+        level = level or os.environ.get("GW_LOG_LEVEL", "INFO")
+        if str(level).lower() in ("off", "none", "0"):
+            return
+        gw = logging.getLogger("gw")
+        try:
+            gw.setLevel(str(level).upper())
+        except ValueError:
+            gw.setLevel(logging.INFO)
+        if not gw.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            gw.addHandler(handler)
+            # 已经在这里输出了：不再交给 root（避免 basicConfig 之后打印两遍）
+            gw.propagate = False
+
+
+def log_enabled(log, level=logging.INFO):
+    """这条日志真的会被输出吗：级别够，而且沿途有 handler（lastResort 只输出 WARNING 以上）。"""
+    return log.isEnabledFor(level) and log.hasHandlers()
+
+
+def mark_miss():
+    """在被缓存的函数体内调用：标记当前阶段为缓存未命中。"""
+    rec = getattr(_local, "record", None)
+    if rec is not None:
+        rec["cache"] = "miss"
+
+
+class Registry:
+    """进程内累计指标（所有 session / rerun 共享），线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._reruns = 0
+        self._rerun_seconds = 0.0
+
+    def observe(self, rec):
+        with self._lock:
+            s = self._stages.setdefault(
+                rec["stage"],
+                {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "hit": 0, "miss": 0},
+            )
+            s["count"] += 1
+            s["seconds"] += rec["seconds"]
+            s["max_seconds"] = max(s["max_seconds"], rec["seconds"])
+            s["bytes"] += int(rec.get("bytes") or 0)
+            if rec.get("cache") in ("hit", "miss"):
+                s[rec["cache"]] += 1
+
+    def observe_rerun(self, seconds):
+        with self._lock:
+            self._reruns += 1
+            self._rerun_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "reruns": self._reruns,
+                "rerun_seconds": self._rerun_seconds,
+                "stages": {k: dict(v) for k, v in self._stages.items()},
+            }
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (0.0.4)。"""
+        snap = self.snapshot()
+        lines = [
+            "# HELP gw_reruns_total Script reruns observed.",
+            "# TYPE gw_reruns_total counter",
+            f"gw_reruns_total {snap['reruns']}",
+            "# HELP gw_rerun_seconds_total Wall time spent in reruns.",
+            "# TYPE gw_rerun_seconds_total counter",
+            f"gw_rerun_seconds_total {snap['rerun_seconds']:.6f}",
+        ]
+        series = [
+            ("gw_stage_calls_total", "counter", "Stage executions.", lambda s: s["count"]),
+            ("gw_stage_seconds_total", "counter", "Wall time per stage.", lambda s: f"{s['seconds']:.6f}"),
+            ("gw_stage_seconds_max", "gauge", "Slowest single execution per stage.", lambda s: f"{s['max_seconds']:.6f}"),
+            ("gw_stage_bytes_total", "counter", "Payload bytes produced per stage.", lambda s: s["bytes"]),
+        ]
+        for name, kind, help_text, get in series:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, s in sorted(snap["stages"].items()):
+                lines.append(f'{name}{{stage="{stage}"}} {get(s)}')
+        lines.append("# HELP gw_cache_requests_total Cache lookups per stage.")
+        lines.append("# TYPE gw_cache_requests_total counter")
+        for stage, s in sorted(snap["stages"].items()):
+            if s["hit"] or s["miss"]:
+                lines.append(f'gw_cache_requests_total{{stage="{stage}",result="hit"}} {s["hit"]}')
+                lines.append(f'gw_cache_requests_total{{stage="{stage}",result="miss"}} {s["miss"]}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class RerunTrace:
+    """一次 rerun 的阶段记录。"""
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.records = []
+        self._t0 = time.perf_counter()
+        self.total_seconds = None
+
+    @contextmanager
+    def stage(self, name, cached=False):
+        """
+        计时一个阶段；yield 出来的 dict 可以写入 "bytes" 等附加字段。
+        cached=True 表示该阶段调用 st.cache_data 函数，会统计命中/未命中。
+        """
+        rec = {"stage": name, "seconds": 0.0, "bytes": None, "cache": "hit" if cached else None}
+        prev = getattr(_local, "record", None)
+        _local.record = rec if cached else prev
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["seconds"] = time.perf_counter() - t0
+            _local.record = prev
+            self.records.append(rec)
+            self.registry.observe(rec)
+
+    def finish(self, **extra):
+        """结束本次 rerun：写入汇总，并输出一行结构化日志（JSON）。"""
+        self.total_seconds = time.perf_counter() - self._t0
+        self.registry.observe_rerun(self.total_seconds)
+        if not log_enabled(logger):
+            return
+        logger.info(
+            json.dumps(
+                {
+                    "event": "rerun",
+                    "total_seconds": round(self.total_seconds, 6),
+                    "stages": [
+                        {
+                            "stage": r["stage"],
+                            "seconds": round(r["seconds"], 6),
+                            "bytes": r["bytes"],
+                            "cache": r["cache"],
+                        }
+                        for r in self.records
+                    ],
+                    **extra,
+                },
+                ensure_ascii=False,
+            )
+        )
+
+    def as_rows(self):
+        """给 st.dataframe 用的表格行。"""
+        return [
+            {
+                "stage": r["stage"],
+                "ms": round(r["seconds"] * 1000, 2),
+                "bytes": r["bytes"],
+                "cache": r["cache"] or "",
+            }
+            for r in self.records
+        ]
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_exporter(port=None, host="127.0.0.1"):
+    """
+    每个进程最多启动一次 /metrics 端点（默认读取 GW_METRICS_PORT；未设置则不启动）。
+    多个 worker 进程时请给每个进程不同端口。
+    """
+    global _server
+    port = port or os.environ.get("GW_METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            except OSError as exc:
+                # 端口被占用等：只报一次，之后不再重试
+                logger.warning("metrics exporter not started on %s:%s (%s)", host, port, exc)
+                _server = False
+                return None
+            threading.Thread(target=_server.serve_forever, name="gw-metrics", daemon=True).start()
+            logger.info("metrics exporter listening on http://%s:%s/metrics", host, port)
+    return _server or None
@@ -0,0 +1,74 @@
+import hmac
+import os
+
+import pandas as pd
+import streamlit as st
+
+import memory_report
+
+st.set_page_config(page_title="Memory Report (admin)", layout="wide")
+st.title("🧠 Memory Report")
+
+# 页面会列出所有在线 session：必须设置 GW_ADMIN_TOKEN 并带 ?token=... 才能查看，没设置 token 时一律拒绝
+ADMIN_TOKEN = os.environ.get("GW_ADMIN_TOKEN")
+if not ADMIN_TOKEN or not hmac.compare_digest(st.query_params.get("token", ""), ADMIN_TOKEN):
+    st.error("This page is for administrators only.")
+    if not ADMIN_TOKEN:
+        st.caption("Set GW_ADMIN_TOKEN on the server and open this page with ?token=... to enable it.")
+    st.stop()
+
+memory_report.start_periodic_log()
+
+
+def mb(n):
+    return f"{(n or 0) / 1024 / 1024:.2f} MB"
+
+
+if st.button("Refresh"):
+    st.rerun()
+
+report = memory_report.collect()
+
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Process RSS", mb(report["rss_bytes"]))
+c2.metric("st.cache_data", mb(report["cache_data_bytes"]))
+c3.metric("Session state", mb(report["session_state_bytes"]), f"{len(report['sessions'])} sessions", delta_color="off")
+c4.metric("Open figures", report["figures"]["open"], mb(report["figures"]["bytes"]), delta_color="off")
+
+st.subheader("st.cache_data")
+if report["cache_data"]:
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {"function": name, "entries": u["entries"], "bytes": u["bytes"], "size": mb(u["bytes"])}
+                for name, u in sorted(report["cache_data"].items(), key=lambda kv: -kv[1]["bytes"])
+            ]
+        ),
+        use_container_width=True,
+        hide_index=True,
+    )
+else:
+    st.caption("No cached entries.")
+
+st.subheader("Other caches")
+if report["custom"]:
+    st.dataframe(
+        pd.DataFrame(
+            [{"source": name, "entries": u["entries"], "bytes": u["bytes"], "size": mb(u["bytes"])} for name, u in report["custom"].items()]
+        ),
+        use_container_width=True,
+        hide_index=True,
+    )
+else:
+    st.caption("No other caches registered in this process.")
+
+st.subheader("Sessions")
+if report["sessions"]:
+    df = pd.DataFrame(report["sessions"]).sort_values("bytes", ascending=False)
+    df["size"] = df["bytes"].map(mb)
+    st.dataframe(df, use_container_width=True, hide_index=True)
+else:
+    st.caption("No active sessions found (or the runtime is not available).")
+
+with st.expander("Log line"):
+    st.code(memory_report.summary_line(report), language="json")
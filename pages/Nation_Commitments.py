@@ -1,45 +1,155 @@
 import streamlit as st
 from pathlib import Path
 
+import numpy as np
+
+import countries
+import era5_data
+import manifest
+import policy_corpus
+import shared_cache
+
 st.title("How each country is acting?")
 
 HERE = Path(__file__).resolve().parent  # pages/ 目录（Nation_Commitments.py 所在目录）
 
-def policy(country: str, txt_dir: Path = HERE, expanded: bool = False):
+# 国家列表来自 pages/*.txt（第一行 "# Country: 全称 (简称, ISO3)"），新增国家只需加文件；
+# 旗帜只是装饰，没有的国家不显示
+FLAGS = {"CHN": "🇨🇳", "DEU": "🇩🇪", "AUS": "🇦🇺", "IND": "🇮🇳", "CAN": "🇨🇦"}
+SEARCH_LIMIT = 30
+
+
+def mark(s):
+    """搜索命中词的高亮样式（传给 policy_corpus.highlight）。"""
+    return f":orange-background[{s}]"
+
+
+@st.cache_resource(show_spinner=False)
+def load_corpus():
+    """所有 session 共用一份：每个文件只解码一次，文件变化（mtime/size）时自动重新解析。"""
+    return policy_corpus.PolicyCorpus(HERE)
+
+
+@st.cache_resource(show_spinner="Preparing country grid...")
+def country_index():
+    """国家编号栅格（countries.py；第一次使用时栅格化，之后读 country_labels.npz）。"""
+    return countries.CountryIndex(countries.load_or_build())
+
+
+@st.cache_resource(show_spinner="Computing country averages...")
+def country_annual_series(version):
     """
-    Create one expander for a country.
-    Inside expander: render the markdown content from <txt_dir>/<country>.txt
+    所有国家的年平均气温序列：每年一次加权 bincount，一次算完所有国家。
+    结果放进共享缓存（shared_cache.STORE），其他 worker 进程直接读。
+    version：用到的数据文件的 series_version；ingest.py 改了其中某个文件才重新计算
     """
-    file_path = txt_dir / f"{country}.txt"
+    index = country_index()
+    key = f"countries:annual:{version}:{index.version}"
 
-    with st.expander(country, expanded=expanded):
-        if not file_path.exists():
-            st.error(f"Missing file: {file_path.name}")
-            return
+    def compute():
+        years, means = countries.annual_series(index)
+        return {"years": years, "means": means}
 
-        # 读取文本（默认 UTF-8；如果你txt是GBK可改成 encoding="gbk"）
-        try:
-            md = file_path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            md = file_path.read_text(encoding="gbk", errors="ignore")
+    return shared_cache.STORE.get_or_compute(key, compute)
 
-        st.markdown(md)
 
-option = st.radio("Click a country to see its international commitments and domestic policies", 
-                  ("🇨🇳China", "🇩🇪Germany","🇦🇺Australia","🇮🇳India","🇨🇦Canada"))
+def series_version():
+    """countries.annual_series 用到的文件（有年平均文件只用它，否则 12 个月）的数据版本。"""
+    data_manifest = manifest.load_or_rebuild(era5_data.DATA_DIR)
+    modes = ["Annual"] if "Annual" in data_manifest["files"] else range(1, 13)
+    return ":".join(str(manifest.series_version(data_manifest, m)) for m in modes)
 
-if st.button("Go"):
-    if option == "🇨🇳China":
-        policy("China")
-    if option == "🇩🇪Germany":
-        policy("Germany")
-    if option == "🇦🇺Australia":
-        policy("Australia")
-    if option == "🇮🇳India":
-        policy("India")
-    if option == "🇨🇦Canada":
-        policy("Canada")
-    
 
+def warming_curve(country: str, iso: str = None):
+    """国家平均气温的逐年曲线 + 10 年滑动平均 + 线性趋势。"""
+    try:
+        index = country_index()
+        series = country_annual_series(series_version())
+    except FileNotFoundError:
+        st.caption("No ERA5 data available for the country warming curve.")
+        return
+    k = index.position(iso) if iso else None
+    if k is None:
+        k = index.position(country)
+    if k is None:
+        st.caption(f"{country} is not in the country boundary dataset.")
+        return
+
+    from matplotlib.figure import Figure
+
+    years = np.asarray(series["years"])
+    temps = np.asarray(series["means"][:, k], dtype=np.float64)
+    ok = np.isfinite(temps)
+    years, temps = years[ok], temps[ok]
+    if len(years) < 2:
+        st.caption(f"Not enough data for {country}.")
+        return
 
+    slope, intercept = np.polyfit(years, temps, 1)
+    window = min(10, len(temps))
+    smooth = np.convolve(temps, np.ones(window) / window, mode="valid")
 
+    fig = Figure(figsize=(8.2, 3.0), dpi=160)
+    ax = fig.subplots()
+    ax.plot(years, temps, color="0.6", lw=1, label="annual mean")
+    ax.plot(years[window - 1 :], smooth, color="tab:red", lw=2, label=f"{window}-year mean")
+    ax.plot(years, slope * years + intercept, color="k", ls="--", lw=1, label=f"trend {slope * 10:+.2f} °C/decade")
+    ax.set_title(f"{country}: area-weighted mean temperature ({int(years[0])}–{int(years[-1])})")
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Temperature (°C)")
+    ax.grid(True, alpha=0.25)
+    ax.legend(loc="upper left", fontsize=8)
+    st.pyplot(fig, use_container_width=True)
+
+
+def policy(doc, expanded: bool = False, terms=()):
+    """
+    Create one expander for a country.
+    Inside expander: the warming curve + the markdown content of <country>.txt（已在 corpus 里解码好）
+    """
+    with st.expander(f"{FLAGS.get(doc.iso, '')}{doc.short}", expanded=expanded):
+        warming_curve(doc.short, doc.iso)
+        st.markdown(policy_corpus.highlight(doc.text, terms, mark=mark) if terms else doc.text)
+
+
+def country_label(key):
+    doc = corpus.get(key)
+    return f"{FLAGS.get(doc.iso, '')}{doc.short}"
+
+
+corpus = load_corpus()
+docs = corpus.countries()
+if not docs:
+    st.info(f"No country files found in {HERE} (expected first line: '# Country: Official name (Short name, ISO3)').")
+    st.stop()
+
+# ---- 全文检索 ----
+query = st.text_input("🔎 Search all countries' policies", placeholder="e.g. coal, renewable, net zero")
+terms = []
+if query.strip():
+    terms, hits = corpus.search(query, limit=SEARCH_LIMIT)
+    if not hits:
+        st.caption(f"No section mentions all of: {', '.join(terms)}")
+    else:
+        n_countries = len({h.doc.key for h in hits})
+        st.caption(f"{len(hits)} matching sections in {n_countries} countries")
+        for hit in hits:
+            heading = hit.section.heading or "Overview"
+            text = policy_corpus.snippet(hit.section, terms)
+            st.markdown(
+                f"**{FLAGS.get(hit.doc.iso, '')}{hit.doc.short}** · {policy_corpus.highlight(heading, terms, mark=mark)}  \n"
+                f"{policy_corpus.highlight(text, terms, mark=mark)}"
+            )
+    st.markdown("---")
+
+# ---- 按国家查看 ----
+label = "Click a country to see its international commitments and domestic policies"
+keys = [doc.key for doc in docs]
+# 国家多了以后单选按钮太长，换成下拉框
+if len(keys) <= 8:
+    option = st.radio(label, keys, format_func=country_label)
+else:
+    option = st.selectbox(label, keys, format_func=country_label)
+
+if st.button("Go"):
+    policy(corpus.get(option), terms=terms)
@@ -0,0 +1,99 @@
+import hmac
+import os
+
+import pandas as pd
+import streamlit as st
+
+import question_bank
+import quiz_log
+
+st.set_page_config(page_title="Quiz Results (teachers)", layout="wide")
+st.title("📊 Quiz Results")
+st.caption("Per-question difficulty and the wrong options students pick most often, across all quiz sessions.")
+
+# 页面会显示答案，学生在侧栏里也能看到它：必须设置 GW_ADMIN_TOKEN 并带 ?token=... 才能查看，
+# 没设置 token 时一律拒绝
+ADMIN_TOKEN = os.environ.get("GW_ADMIN_TOKEN")
+if not ADMIN_TOKEN or not hmac.compare_digest(st.query_params.get("token", ""), ADMIN_TOKEN):
+    st.error("This page is for teachers only.")
+    if not ADMIN_TOKEN:
+        st.caption("Set GW_ADMIN_TOKEN on the server and open this page with ?token=... to enable it.")
+    st.stop()
+
+
+@st.cache_resource
+def load_bank():
+    return question_bank.QuestionBank()
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def load_stats():
+    # 只读统计表（大小 = 题目数），几个老师同时刷新也不会压到写入
+    return quiz_log.read_stats()
+
+
+if quiz_log.default_path() is None:
+    st.info("Answer logging is turned off (GW_QUIZ_DB=off).")
+    st.stop()
+
+if st.button("Refresh"):
+    load_stats.clear()
+    st.rerun()
+
+stats = load_stats()
+if not stats or not stats["answers"]:
+    st.info("No answers recorded yet.")
+    st.stop()
+
+bank = load_bank().current()
+
+c1, c2, c3 = st.columns(3)
+c1.metric("Answers", stats["answers"])
+c2.metric("Sessions", stats["sessions"])
+c3.metric("Overall accuracy", f"{stats['correct'] / stats['answers'] * 100:.1f}%")
+
+rows = []
+for qid, q in stats["questions"].items():
+    question = bank.get(qid)
+    answer = question.answer if question else None
+    wrong = quiz_log.distractor_rates(q, answer)
+    top = next(iter(wrong.items()), (None, 0.0))
+    row = {
+        "id": qid,
+        "question": question.q if question else "(removed from bank)",
+        "answer": answer or "",
+        "attempts": q["attempts"],
+        "accuracy %": round(q["accuracy"] * 100, 1),
+        "mean time (s)": round(q["mean_latency_s"], 1),
+        "top distractor": f"{top[0]} ({top[1] * 100:.0f}%)" if top[0] else "-",
+    }
+    for letter in "ABCD":
+        row[letter] = round(q["choices"].get(letter, 0) / q["attempts"] * 100, 1)
+    rows.append(row)
+
+# 最难的题排在最前面
+df = pd.DataFrame(rows).sort_values(["accuracy %", "attempts"], ascending=[True, False])
+
+st.subheader("Questions")
+st.dataframe(
+    df,
+    use_container_width=True,
+    hide_index=True,
+    column_config={letter: st.column_config.NumberColumn(f"{letter} %", format="%.1f") for letter in "ABCD"},
+)
+
+st.subheader("Question detail")
+qid = st.selectbox("Question", df["id"].tolist(), format_func=lambda i: f"{i}. {df.loc[df['id'] == i, 'question'].iloc[0][:80]}")
+question = bank.get(qid)
+q = stats["questions"][qid]
+if question:
+    chart = pd.DataFrame(
+        {
+            "option": [f"{k}. {v}" for k, v in question.options.items()],
+            "chosen %": [q["choices"].get(k, 0) / q["attempts"] * 100 for k in question.options],
+        }
+    ).set_index("option")
+    st.bar_chart(chart, horizontal=True)
+    st.caption(f"Correct answer: **{question.answer}**. {q['attempts']} attempts, {q['accuracy'] * 100:.1f}% correct.")
+else:
+    st.caption("This question is no longer in the question bank.")
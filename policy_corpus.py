@@ -0,0 +1,197 @@
+"""
+各国气候政策文本（pages/*.txt）的缓存 + 全文检索（不依赖 streamlit）。
+
+- 自动发现：第一行是 "# Country: 全称 (简称, ISO3)" 的 .txt 都算一个国家，新增国家只要放一个文件
+- 每个文件只解码一次（UTF-8，失败再试 GBK），按 mtime/size 失效；目录最多每 REFRESH_SECONDS 秒 stat 一次
+- 按 "## 标题" 切成小节，建倒排索引：词 -> {(国家, 小节): 次数}；
+  查询词按前缀匹配（"renew" 能命中 "renewable"），多个词要求落在同一小节
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+from pathlib import Path
+
+HEADER_RE = re.compile(r"^#\s*Country:\s*(?P<official>.+?)\s*\((?P<short>[^,()]+),\s*(?P<iso>[A-Z]{3})\)\s*$")
+HEADING_RE = re.compile(r"^#{2,6}\s+(?P<title>.+?)\s*$")
+# 拉丁字母 / 数字连成词；中日韩文字逐字切分
+TOKEN_RE = re.compile(r"[\u4e00-\u9fff]|[^\W_\u4e00-\u9fff]+")
+
+REFRESH_SECONDS = 1.0
+
+PolicyDoc = namedtuple("PolicyDoc", "key short official iso path text sections")
+Section = namedtuple("Section", "heading body")
+Hit = namedtuple("Hit", "doc section score")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def decode(raw):
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("gbk", errors="ignore")
+
+
+def split_sections(text):
+    """按 ## 标题切分；第一行 "# Country:" 本身不算小节。"""
+    sections = []
+    heading, body = None, []
+    for line in text.splitlines()[1:]:
+        m = HEADING_RE.match(line)
+        if m:
+            if heading is not None or any(s.strip() for s in body):
+                sections.append(Section(heading or "", "\n".join(body).strip()))
+            heading, body = m["title"].rstrip(), []
+        elif line.strip() != "---":
+            body.append(line)
+    if heading is not None or any(s.strip() for s in body):
+        sections.append(Section(heading or "", "\n".join(body).strip()))
+    return sections
+
+
+def parse_policy(path, raw):
+    """-> PolicyDoc；不是国家文件（第一行不是 "# Country:"）时返回 None。"""
+    text = decode(raw).lstrip("\ufeff")
+    first = text.split("\n", 1)[0].strip()
+    m = HEADER_RE.match(first)
+    if not m:
+        return None
+    return PolicyDoc(
+        key=Path(path).stem,
+        short=m["short"].strip(),
+        official=m["official"].strip(),
+        iso=m["iso"],
+        path=str(path),
+        text=text,
+        sections=split_sections(text),
+    )
+
+
+def highlight(text, terms, mark=lambda s: f"**{s}**"):
+    """把 text 里以 terms 开头的词用 mark() 包起来（不区分大小写）。"""
+    if not terms:
+        return text
+    latin = sorted((t for t in terms if not re.match(r"[\u4e00-\u9fff]", t)), key=len, reverse=True)
+    cjk = [t for t in terms if re.match(r"[\u4e00-\u9fff]", t)]
+    parts = [r"(?<![^\W_])" + re.escape(t) + r"[^\W_]*" for t in latin] + [re.escape(t) for t in cjk]
+    pattern = re.compile("|".join(parts), re.IGNORECASE)
+    return pattern.sub(lambda m: mark(m.group(0)), text)
+
+
+def snippet(section, terms, width=280):
+    """小节里第一处命中附近的一段文字（没有命中时取小节开头）。"""
+    lines = [line.strip() for line in section.body.splitlines() if line.strip()]
+    for line in lines:
+        tokens = tokenize(line)
+        if any(tok.startswith(t) for t in terms for tok in tokens):
+            break
+    else:
+        line = lines[0] if lines else ""
+    if len(line) <= width:
+        return line
+    lower = line.lower()
+    pos = min((lower.find(t) for t in terms if lower.find(t) >= 0), default=0)
+    start = max(0, pos - width // 3)
+    return ("…" if start else "") + line[start : start + width].strip() + "…"
+
+
+class PolicyCorpus:
+    """目录里所有国家文件的解析结果和倒排索引；线程安全，所有 session 共用一个。"""
+
+    def __init__(self, txt_dir, refresh_seconds=REFRESH_SECONDS):
+        self.txt_dir = Path(txt_dir)
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._files = {}  # 文件名 -> ((mtime_ns, size), PolicyDoc 或 None)
+        # (docs, postings, vocab)：重建时整体替换，读者拿到的总是同一版
+        self._state = ({}, {}, [])
+        self._checked = 0.0
+
+    # ---- 缓存与失效 ----
+    def refresh(self, force=False):
+        """stat 目录；有文件新增 / 删除 / 修改时只重新解析变化的文件，再重建索引。"""
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_seconds:
+            return
+        with self._lock:
+            if not force and now - self._checked < self.refresh_seconds:
+                return
+            stamps = {}
+            for entry in os.scandir(self.txt_dir):
+                if entry.is_file() and entry.name.endswith(".txt"):
+                    st_ = entry.stat()
+                    stamps[entry.name] = (st_.st_mtime_ns, st_.st_size)
+
+            changed = set(stamps) ^ set(self._files)
+            changed |= {name for name, stamp in stamps.items() if name in self._files and self._files[name][0] != stamp}
+            if changed:
+                files = {}
+                for name, stamp in stamps.items():
+                    if name in self._files and self._files[name][0] == stamp:
+                        files[name] = self._files[name]
+                    else:
+                        path = self.txt_dir / name
+                        files[name] = (stamp, parse_policy(path, path.read_bytes()))
+                self._files = files
+                self._rebuild_index()
+            self._checked = time.monotonic()
+
+    def _rebuild_index(self):
+        docs = {doc.key: doc for _, doc in self._files.values() if doc is not None}
+        postings = defaultdict(lambda: defaultdict(int))
+        for key, doc in docs.items():
+            for k, section in enumerate(doc.sections):
+                for tok in tokenize(section.heading + "\n" + section.body):
+                    postings[tok][(key, k)] += 1
+        postings = {tok: dict(p) for tok, p in postings.items()}
+        self._state = (dict(sorted(docs.items(), key=lambda kv: kv[1].short.lower())), postings, sorted(postings))
+
+    # ---- 查询 ----
+    def countries(self):
+        self.refresh()
+        return list(self._state[0].values())
+
+    def get(self, key):
+        self.refresh()
+        return self._state[0].get(key)
+
+    @staticmethod
+    def _matches(postings, vocab, term):
+        """前缀匹配：{(国家, 小节): 次数}。"""
+        out = defaultdict(int)
+        i = bisect.bisect_left(vocab, term)
+        while i < len(vocab) and vocab[i].startswith(term):
+            for loc, n in postings[vocab[i]].items():
+                out[loc] += n
+            i += 1
+        return out
+
+    def search(self, query, limit=50):
+        """所有词都出现在同一小节里的结果，按命中次数排序。返回 (terms, [Hit, ...])。"""
+        self.refresh()
+        docs, postings, vocab = self._state
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return terms, []
+        scores = None
+        for term in terms:
+            found = self._matches(postings, vocab, term)
+            if scores is None:
+                scores = dict(found)
+            else:
+                scores = {loc: s + found[loc] for loc, s in scores.items() if loc in found}
+            if not scores:
+                return terms, []
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], docs[kv[0][0]].short, kv[0][1]))
+        hits = [Hit(docs[key], docs[key].sections[k], score) for (key, k), score in ranked[:limit]]
+        return terms, hits
+
+    def stats(self):
+        """(国家数, 索引词数)。"""
+        docs, _, vocab = self._state
+        return len(docs), len(vocab)
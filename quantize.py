@@ -0,0 +1,47 @@
+"""
+气温场的紧凑表示：int16 + scale/offset，NaN 用哨兵值表示。
+
+0.01 °C 的分辨率对于显示和统计都没有可见差别，而 int16 只有 float32 的一半大小：
+共享缓存里每帧占用减半，发给地图的数值也只保留两位小数。
+坐标同样量化：经纬度保留 COORD_DECIMALS 位小数（0.001° ≈ 100 m，远小于一个格子）。
+
+环境变量 GW_QUANTIZE=0 可以关闭（缓存里改存 float32）。
+"""
+import os
+
+import numpy as np
+
+ENABLED = os.environ.get("GW_QUANTIZE", "1") != "0"
+
+SCALE = 0.01  # °C
+OFFSET = 0.0
+NAN_SENTINEL = np.iinfo(np.int16).min  # -32768，不会与有效值冲突（有效范围约 ±327 °C）
+
+COORD_DECIMALS = 3
+VALUE_DECIMALS = 2
+
+
+def quantize(values, scale=SCALE, offset=OFFSET):
+    """float -> int16（NaN -> NAN_SENTINEL，超出范围的值截断）。"""
+    values = np.asarray(values, dtype=np.float64)
+    q = np.round((values - offset) / scale)
+    lo, hi = NAN_SENTINEL + 1, np.iinfo(np.int16).max
+    q = np.clip(np.nan_to_num(q, nan=NAN_SENTINEL), NAN_SENTINEL, hi)
+    q[np.isfinite(values) & (q == NAN_SENTINEL)] = lo
+    return q.astype(np.int16)
+
+
+def dequantize(q, scale=SCALE, offset=OFFSET):
+    """int16 -> float32（NAN_SENTINEL -> NaN）。"""
+    q = np.asarray(q)
+    out = q.astype(np.float32) * np.float32(scale) + np.float32(offset)
+    out[q == NAN_SENTINEL] = np.nan
+    return out
+
+
+def round_coord(x):
+    return round(float(x), COORD_DECIMALS)
+
+
+def round_value(x):
+    return round(float(x), VALUE_DECIMALS)
@@ -0,0 +1,264 @@
+"""
+气候变化题库（pages/气候变化题库.txt）的解析 + 进程内缓存（不依赖 streamlit）。
+
+    python question_bank.py [--file pages/气候变化题库.txt] check
+    python question_bank.py [--file ...] sample -n 10 [--tag ocean] [--difficulty easy]
+
+文本格式（题与题之间空行分隔）：
+
+    12. An object can emit radiation that is proportional to D
+    A. its temperature
+    B. the square of its temperature
+    ...
+    Tags: radiation, physics        <- 可选，逗号分隔
+    Difficulty: hard                <- 可选，easy / medium / hard
+
+    解释（可以多行，直到下一道题）
+
+- 题号就是题目 id（session 里只存 id）；题号重复、答案不在选项里、选项字母不连续等都会报出行号
+- 按 mtime/size 失效，最多每 REFRESH_SECONDS 秒 stat 一次；改坏了的文件不会替换掉上一版好的题库
+- 按标签 / 难度建好下标列表，抽题只在下标上 random.sample，几千道题也只是几微秒
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, namedtuple
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+BANK_FILE = APP_DIR / "pages" / "气候变化题库.txt"
+
+QUESTION_RE = re.compile(r"^(?P<id>\d+)\.\s+(?P<q>.+?)\s+(?P<answer>[A-Z])$")
+OPTION_RE = re.compile(r"^(?P<letter>[A-Z])\.\s+(?P<text>.+)$")
+META_RE = re.compile(r"^(?P<key>tags|difficulty)\s*[:：]\s*(?P<value>.*)$", re.IGNORECASE)
+
+DIFFICULTIES = ("easy", "medium", "hard")
+REFRESH_SECONDS = 1.0
+
+Question = namedtuple("Question", "id q options answer explanation tags difficulty line")
+
+
+class BankError(ValueError):
+    """题库文件有格式问题；problems 是 ["line N: ...", ...]。"""
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        super().__init__("; ".join(self.problems[:5]) + (f" (+{len(self.problems) - 5} more)" if len(self.problems) > 5 else ""))
+
+
+def decode(raw):
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("gbk", errors="ignore")
+
+
+def _blocks(lines):
+    """按题目行切块：-> [(行号, [行, ...])]；第一道题之前的非空行单独成块（会被报错）。"""
+    blocks, start, cur = [], None, []
+    for no, line in enumerate(lines, start=1):
+        if QUESTION_RE.match(line.strip()):
+            if cur:
+                blocks.append((start, cur))
+            start, cur = no, [line.strip()]
+        elif cur or line.strip():
+            if start is None:
+                start = no
+            cur.append(line.rstrip())
+    if cur:
+        blocks.append((start, cur))
+    return blocks
+
+
+def _parse_block(start, block, problems):
+    m = QUESTION_RE.match(block[0])
+    if not m:
+        problems.append(f"line {start}: expected 'N. question ANSWER', got {block[0][:60]!r}")
+        return None
+    qid, text, answer = int(m["id"]), m["q"], m["answer"]
+    options, tags, difficulty, explanation = {}, (), None, []
+    k = 1
+    # 选项紧跟在题目行后面
+    while k < len(block) and OPTION_RE.match(block[k].strip()):
+        o = OPTION_RE.match(block[k].strip())
+        options[o["letter"]] = o["text"].strip()
+        k += 1
+    for offset, line in enumerate(block[k:], start=start + k):
+        meta = META_RE.match(line.strip())
+        if meta and meta["key"].lower() == "tags":
+            tags = tuple(dict.fromkeys(t.strip().lower() for t in meta["value"].split(",") if t.strip()))
+        elif meta:
+            difficulty = meta["value"].strip().lower() or None
+            if difficulty not in DIFFICULTIES + (None,):
+                problems.append(f"line {offset}: difficulty must be one of {', '.join(DIFFICULTIES)}")
+                difficulty = None
+        else:
+            explanation.append(line.strip())
+
+    letters = list(options)
+    expected = [chr(ord("A") + i) for i in range(len(letters))]
+    if len(letters) < 2:
+        problems.append(f"line {start}: question {qid} needs at least two options")
+    elif letters != expected:
+        problems.append(f"line {start}: question {qid} options should be {'/'.join(expected)}, got {'/'.join(letters)}")
+    if answer not in options:
+        problems.append(f"line {start}: question {qid} answer {answer} is not one of its options")
+    return Question(
+        id=qid,
+        q=text,
+        options=options,
+        answer=answer,
+        explanation="\n".join(explanation).strip(),
+        tags=tags,
+        difficulty=difficulty,
+        line=start,
+    )
+
+
+def parse_bank(text):
+    """-> [Question, ...]（按文件顺序）；有任何问题时抛 BankError，列出所有问题。"""
+    problems = []
+    questions, seen = [], {}
+    for start, block in _blocks(text.lstrip("\ufeff").splitlines()):
+        q = _parse_block(start, block, problems)
+        if q is None:
+            continue
+        if q.id in seen:
+            problems.append(f"line {start}: duplicate question id {q.id} (first at line {seen[q.id]})")
+            continue
+        seen[q.id] = start
+        questions.append(q)
+    if not questions and not problems:
+        problems.append("line 1: no questions found")
+    if problems:
+        raise BankError(problems)
+    return questions
+
+
+class CompiledBank:
+    """一版解析好的题库：按位置存题目，id / 标签 / 难度都映射到位置下标。只读，可在线程间共享。"""
+
+    def __init__(self, questions, stamp=None):
+        self.questions = tuple(questions)
+        self.stamp = stamp
+        self.position = {q.id: k for k, q in enumerate(self.questions)}
+        by_tag, by_difficulty = defaultdict(list), defaultdict(list)
+        for k, q in enumerate(self.questions):
+            for tag in q.tags:
+                by_tag[tag].append(k)
+            by_difficulty[q.difficulty].append(k)
+        self.by_tag = {t: tuple(v) for t, v in sorted(by_tag.items())}
+        self.by_difficulty = {d: tuple(v) for d, v in by_difficulty.items()}
+
+    def __len__(self):
+        return len(self.questions)
+
+    def get(self, qid):
+        k = self.position.get(qid)
+        return None if k is None else self.questions[k]
+
+    def tags(self):
+        return list(self.by_tag)
+
+    def difficulties(self):
+        return [d for d in DIFFICULTIES if d in self.by_difficulty]
+
+    def candidates(self, tags=None, difficulty=None):
+        """满足条件的题目位置：任一标签命中即可；difficulty 可以是一个或多个等级。"""
+        positions = None
+        if tags:
+            positions = set()
+            for tag in tags:
+                positions.update(self.by_tag.get(tag, ()))
+        if difficulty:
+            levels = [difficulty] if isinstance(difficulty, str) else difficulty
+            matched = set()
+            for level in levels:
+                matched.update(self.by_difficulty.get(level, ()))
+            positions = matched if positions is None else positions & matched
+        if positions is None:
+            return range(len(self.questions))
+        return sorted(positions)
+
+    def sample(self, n, tags=None, difficulty=None, rng=random):
+        """随机抽 n 道题（不足 n 道时全抽），返回题目 id。"""
+        pool = self.candidates(tags, difficulty)
+        picked = rng.sample(pool, k=min(n, len(pool)))
+        return [self.questions[k].id for k in picked]
+
+
+class QuestionBank:
+    """题库文件的进程级缓存；线程安全，所有 session 共用一个。"""
+
+    def __init__(self, path=BANK_FILE, refresh_seconds=REFRESH_SECONDS):
+        self.path = Path(path)
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._bank = None
+        self._checked = 0.0
+        # 最近一次解析失败的原因（仍在用上一版时页面可以提示）
+        self.error = None
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._bank is not None and now - self._checked < self.refresh_seconds:
+            return self._bank
+        with self._lock:
+            if not force and self._bank is not None and now - self._checked < self.refresh_seconds:
+                return self._bank
+            st_ = os.stat(self.path)
+            stamp = (st_.st_mtime_ns, st_.st_size)
+            if self._bank is None or self._bank.stamp != stamp:
+                try:
+                    questions = parse_bank(decode(self.path.read_bytes()))
+                except BankError as exc:
+                    if self._bank is None:
+                        raise
+                    self.error = exc
+                    # 记下这个 stamp：坏文件不用每秒重新解析，改好后 stamp 变化会再试
+                    self._bank = CompiledBank(self._bank.questions, stamp)
+                else:
+                    self._bank = CompiledBank(questions, stamp)
+                    self.error = None
+            self._checked = time.monotonic()
+            return self._bank
+
+    def current(self):
+        """当前这一版 CompiledBank（一次 rerun 里拿一次，前后一致）。"""
+        return self.refresh()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate and sample the climate quiz question bank")
+    parser.add_argument("--file", default=str(BANK_FILE))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("check", help="parse the bank and report problems")
+    p = sub.add_parser("sample", help="print a random set of question ids")
+    p.add_argument("-n", type=int, default=10)
+    p.add_argument("--tag", action="append")
+    p.add_argument("--difficulty", action="append", choices=DIFFICULTIES)
+    args = parser.parse_args(argv)
+
+    try:
+        bank = CompiledBank(parse_bank(decode(Path(args.file).read_bytes())))
+    except BankError as exc:
+        for problem in exc.problems:
+            print(problem, file=sys.stderr)
+        return 1
+    if args.cmd == "check":
+        tags = ", ".join(f"{t} ({len(v)})" for t, v in bank.by_tag.items()) or "-"
+        levels = ", ".join(f"{d or 'unrated'} ({len(v)})" for d, v in bank.by_difficulty.items())
+        print(f"{len(bank)} questions; tags: {tags}; difficulty: {levels}")
+        return 0
+    for qid in bank.sample(args.n, args.tag, args.difficulty):
+        q = bank.get(qid)
+        print(f"{qid}\t{q.answer}\t{q.q}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+测验答题记录：后台线程批量写 SQLite（write-behind），外加增量维护的按题统计（不依赖 streamlit）。
+
+    python quiz_log.py [--db quiz_results.sqlite] report
+    python quiz_log.py [--db ...] rebuild      # 从明细表重新算统计表
+
+- 页面里 record() 只往内存队列里放一条，立刻返回，答题永远不等磁盘
+- 写线程攒够 BATCH_SIZE 条或等满 FLUSH_SECONDS 秒写一次：明细 + 统计表在同一个事务里，
+  统计表用 UPSERT 累加（n = n + 本批次数），读统计不用扫明细表
+- WAL 模式 + busy_timeout：多个 worker 进程可以同时写同一个库，老师页面读的时候也不挡写入
+- 队列满（数据库长时间锁住）时丢弃新记录并计数，不拖慢页面
+
+环境变量：GW_QUIZ_DB（数据库路径；设为 off 关闭记录）。
+"""
+import argparse
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from pathlib import Path
+
+logger = logging.getLogger("gw.quiz_log")
+
+APP_DIR = Path(__file__).resolve().parent
+BATCH_SIZE = 200
+FLUSH_SECONDS = 1.0
+QUEUE_SIZE = 100000
+
+Answer = namedtuple("Answer", "ts session question_id chosen correct latency_ms")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    session TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    chosen TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_ms INTEGER
+);
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INTEGER PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_ms_sum INTEGER NOT NULL,
+    last_ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS choice_stats (
+    question_id INTEGER NOT NULL,
+    chosen TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (question_id, chosen)
+);
+CREATE TABLE IF NOT EXISTS session_stats (
+    session TEXT PRIMARY KEY,
+    answers INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL
+);
+"""
+
+
+def default_path():
+    """GW_QUIZ_DB；未设置时放在应用目录；设为 off 时返回 None（不记录）。"""
+    env = os.environ.get("GW_QUIZ_DB")
+    if env is not None:
+        return None if env.lower() in ("", "0", "off", "none") else Path(env)
+    return APP_DIR / "quiz_results.sqlite"
+
+
+def connect(path):
+    conn = sqlite3.connect(str(path), timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def write_batch(conn, batch):
+    """一批答题记录：明细 + 三张统计表，一个事务。"""
+    per_question = defaultdict(lambda: [0, 0, 0, 0.0])
+    per_choice = Counter()
+    per_session = {}
+    for a in batch:
+        q = per_question[a.question_id]
+        q[0] += 1
+        q[1] += int(a.correct)
+        q[2] += int(a.latency_ms or 0)
+        q[3] = max(q[3], a.ts)
+        per_choice[(a.question_id, a.chosen)] += 1
+        s = per_session.setdefault(a.session, [0, 0, a.ts, a.ts])
+        s[0] += 1
+        s[1] += int(a.correct)
+        s[2] = min(s[2], a.ts)
+        s[3] = max(s[3], a.ts)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO answers (ts, session, question_id, chosen, correct, latency_ms) VALUES (?, ?, ?, ?, ?, ?)",
+            [(a.ts, a.session, a.question_id, a.chosen, int(a.correct), a.latency_ms) for a in batch],
+        )
+        conn.executemany(
+            "INSERT INTO question_stats (question_id, attempts, correct, latency_ms_sum, last_ts) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(question_id) DO UPDATE SET attempts = attempts + excluded.attempts, "
+            "correct = correct + excluded.correct, latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum, "
+            "last_ts = max(last_ts, excluded.last_ts)",
+            [(qid, *v) for qid, v in per_question.items()],
+        )
+        conn.executemany(
+            "INSERT INTO choice_stats (question_id, chosen, n) VALUES (?, ?, ?) "
+            "ON CONFLICT(question_id, chosen) DO UPDATE SET n = n + excluded.n",
+            [(qid, chosen, n) for (qid, chosen), n in per_choice.items()],
+        )
+        conn.executemany(
+            "INSERT INTO session_stats (session, answers, correct, first_ts, last_ts) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(session) DO UPDATE SET answers = answers + excluded.answers, "
+            "correct = correct + excluded.correct, first_ts = min(first_ts, excluded.first_ts), "
+            "last_ts = max(last_ts, excluded.last_ts)",
+            [(sid, *v) for sid, v in per_session.items()],
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+class AnswerLog:
+    """每个进程一个：record() 进队列，后台线程批量落盘。"""
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS, queue_size=QUEUE_SIZE):
+        self.path = Path(path) if path else default_path()
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gw-quiz-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, 5.0)
+
+    def record(self, session, question_id, chosen, correct, latency_ms=None):
+        """不阻塞：队列满时丢弃这一条。"""
+        if not self.enabled:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(Answer(time.time(), str(session), int(question_id), str(chosen), bool(correct), latency_ms))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """等队列里已有的记录都写完（测试 / 退出时用）。"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        conn = None
+        batch, waiters = [], []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+            if not (batch or waiters):
+                continue
+            if waiters or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    try:
+                        if conn is None:
+                            self.path.parent.mkdir(parents=True, exist_ok=True)
+                            conn = connect(self.path)
+                        write_batch(conn, batch)
+                        self.written += len(batch)
+                        self.batches += 1
+                    except Exception:
+                        # 写不进去（磁盘满 / 只读）：丢掉这批，页面照常运行
+                        logger.exception("failed to write %d quiz answers to %s", len(batch), self.path)
+                        self.dropped += len(batch)
+                        conn = None
+                for event in waiters:
+                    event.set()
+                batch, waiters, deadline = [], [], None
+
+
+# ----------------------------
+# 统计（老师页面 / CLI）
+# ----------------------------
+def read_stats(path=None):
+    """
+    -> {"answers", "sessions", "correct", "questions": {question_id: {...}}}；
+    每道题：attempts / correct / accuracy / mean_latency_s / choices {字母: 次数} / last_ts。
+    只读统计表，与明细表大小无关。数据库不存在时返回 None。
+    """
+    path = Path(path) if path else default_path()
+    if path is None or not path.exists():
+        return None
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    try:
+        questions = {}
+        for qid, attempts, correct, latency_sum, last_ts in conn.execute(
+            "SELECT question_id, attempts, correct, latency_ms_sum, last_ts FROM question_stats"
+        ):
+            questions[qid] = {
+                "attempts": attempts,
+                "correct": correct,
+                "accuracy": correct / attempts if attempts else float("nan"),
+                "mean_latency_s": latency_sum / attempts / 1000 if attempts else float("nan"),
+                "choices": {},
+                "last_ts": last_ts,
+            }
+        for qid, chosen, n in conn.execute("SELECT question_id, chosen, n FROM choice_stats ORDER BY chosen"):
+            if qid in questions:
+                questions[qid]["choices"][chosen] = n
+        sessions, answers, correct = conn.execute(
+            "SELECT count(*), coalesce(sum(answers), 0), coalesce(sum(correct), 0) FROM session_stats"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"answers": answers, "sessions": sessions, "correct": correct, "questions": questions}
+
+
+def distractor_rates(stats, answer):
+    """一道题的各错误选项被选比例（占作答次数），按比例从高到低。"""
+    attempts = stats["attempts"] or 1
+    rates = {letter: n / attempts for letter, n in stats["choices"].items() if letter != answer}
+    return dict(sorted(rates.items(), key=lambda kv: -kv[1]))
+
+
+def rebuild_stats(path=None):
+    """从明细表重新计算所有统计表（统计表损坏或手工删改过明细之后用）。"""
+    path = Path(path) if path else default_path()
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in ("question_stats", "choice_stats", "session_stats"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            "INSERT INTO question_stats SELECT question_id, count(*), sum(correct), coalesce(sum(latency_ms), 0), max(ts) "
+            "FROM answers GROUP BY question_id"
+        )
+        conn.execute("INSERT INTO choice_stats SELECT question_id, chosen, count(*) FROM answers GROUP BY question_id, chosen")
+        conn.execute(
+            "INSERT INTO session_stats SELECT session, count(*), sum(correct), min(ts), max(ts) FROM answers GROUP BY session"
+        )
+        conn.execute("COMMIT")
+        return conn.execute("SELECT count(*) FROM answers").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quiz answer log: per-question difficulty and distractor report")
+    parser.add_argument("--db", default=None, help="SQLite file (default: GW_QUIZ_DB or quiz_results.sqlite)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("report", help="print per-question accuracy and most-chosen wrong option")
+    sub.add_parser("rebuild", help="recompute the aggregate tables from the raw answers")
+    args = parser.parse_args(argv)
+
+    path = Path(args.db) if args.db else default_path()
+    if path is None:
+        print("quiz logging is disabled (GW_QUIZ_DB=off)", file=sys.stderr)
+        return 1
+    if args.cmd == "rebuild":
+        print(f"rebuilt statistics from {rebuild_stats(path)} answers")
+        return 0
+
+    stats = read_stats(path)
+    if stats is None:
+        print(f"no answers recorded yet ({path})", file=sys.stderr)
+        return 1
+    import question_bank
+
+    bank = question_bank.QuestionBank().current()
+    print(f"{stats['answers']} answers from {stats['sessions']} sessions")
+    for qid, q in sorted(stats["questions"].items(), key=lambda kv: kv[1]["accuracy"]):
+        question = bank.get(qid)
+        wrong = distractor_rates(q, question.answer if question else None)
+        top = next(iter(wrong.items()), None)
+        top_text = f"{top[0]} {top[1] * 100:4.1f}%" if top else "-"
+        title = question.q[:60] if question else "(not in bank)"
+        print(f"{qid:>5}  {q['attempts']:>6}  {q['accuracy'] * 100:5.1f}%  {q['mean_latency_s']:6.1f}s  {top_text:>9}  {title}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
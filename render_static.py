@@ -0,0 +1,268 @@
+"""
+离线渲染静态站点：把每个 (mode, year) 的气温图和色标预先画成图片，外加一个带年份滑块的 index.html。
+
+    python render_static.py [--out static_site] [--workers 4] [--format webp] [--cmap turbo]
+
+访问量突增（比如整个班级同时打开页面）时，可以把 static_site/ 交给 CDN / 任何静态文件服务器，
+完全不占 Python 进程。
+
+- 数据和色标与页面一致：era5_data.read_year_field（量化开启时同样经过 int16 往返）、
+  era5_data.color_limits / colorize / draw_colorbar
+- 地图是等经纬度投影的栅格，一个格子一个像素（NaN 透明），由浏览器按 image-rendering: pixelated 放大：
+  文件只有几 KB，编码也快
+- 多进程渲染（ProcessPoolExecutor），同一个 mode 的帧尽量分给同一个进程，复用已打开的文件
+- 增量：frames.json 记录每帧的数据版本（manifest.year_version）和渲染参数，没变的帧直接跳过
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import era5_data
+import manifest
+import quantize
+from era5_data import APP_DIR, DATA_DIR, all_modes, file_for_mode
+
+STATIC_DIR = APP_DIR / "static_site"
+INDEX_FILE = "frames.json"
+
+
+def _mode_dir(mode):
+    return manifest.mode_key(mode)
+
+
+def frame_paths(mode, year, fmt):
+    """相对 out_dir 的 (地图, 色标) 路径。"""
+    key = _mode_dir(mode)
+    return f"maps/{key}/{int(year)}.{fmt}", f"colorbars/{key}/{int(year)}.png"
+
+
+def display_field(mode, year, data_dir=DATA_DIR):
+    """页面上看到的那一帧：原始分辨率，量化开启时做同样的 int16 往返。"""
+    lat, lon, temp_c = era5_data.read_year_field(file_for_mode(mode, 0, data_dir), year)
+    if quantize.ENABLED:
+        temp_c = quantize.dequantize(quantize.quantize(temp_c))
+    return lat, lon, temp_c
+
+
+def field_image(lat, lon, temp_c, cmap_name):
+    """-> (RGBA uint8 数组(北在上), vmin, vmax)。"""
+    vmin, vmax = era5_data.color_limits(temp_c)
+    rgb = era5_data.colorize(temp_c, vmin, vmax, cmap_name)
+    alpha = np.where(np.isfinite(temp_c), 255, 0).astype(np.uint8)
+    rgba = np.dstack([rgb, alpha])
+    if len(lat) > 1 and lat[0] < lat[-1]:
+        rgba = rgba[::-1]
+    return np.ascontiguousarray(rgba), vmin, vmax
+
+
+def _save_image(rgba, path, fmt):
+    from PIL import Image
+
+    img = Image.fromarray(rgba, "RGBA")
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    if fmt == "webp":
+        # 色块图用无损 WebP 比 PNG 小得多
+        img.save(tmp, "WEBP", lossless=True, quality=100, method=4)
+    else:
+        img.save(tmp, "PNG", optimize=True)
+    os.replace(tmp, path)
+
+
+def render_frame(task):
+    """子进程里渲染一帧；返回写进 frames.json 的记录。"""
+    mode, year, data_dir, out_dir, fmt, cmap_name, version = task
+    out_dir = Path(out_dir)
+    lat, lon, temp_c = display_field(mode, year, data_dir)
+    rgba, vmin, vmax = field_image(lat, lon, temp_c, cmap_name)
+
+    map_rel, cb_rel = frame_paths(mode, year, fmt)
+    for rel in (map_rel, cb_rel):
+        (out_dir / rel).parent.mkdir(parents=True, exist_ok=True)
+    _save_image(rgba, out_dir / map_rel, fmt)
+
+    fig = era5_data.draw_colorbar(vmin, vmax, cmap_name)
+    tmp = out_dir / f"{cb_rel}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format="png")
+    os.replace(tmp, out_dir / cb_rel)
+
+    return {
+        "mode": _mode_dir(mode),
+        "year": int(year),
+        "version": version,
+        "map": map_rel,
+        "colorbar": cb_rel,
+        "vmin": round(vmin, 2),
+        "vmax": round(vmax, 2),
+        "bounds": [float(np.min(lon)), float(np.min(lat)), float(np.max(lon)), float(np.max(lat))],
+    }
+
+
+def read_index(out_dir):
+    try:
+        return json.loads((Path(out_dir) / INDEX_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"frames": {}}
+
+
+def write_index(index, out_dir):
+    path = Path(out_dir) / INDEX_FILE
+    tmp = path.with_suffix(f".json.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def plan(data_manifest, out_dir, fmt, cmap_name, modes=None):
+    """-> (需要渲染的任务, 可以沿用的旧记录)。"""
+    previous = read_index(out_dir)["frames"]
+    data_dir = data_manifest["data_dir"]
+    modes = modes or all_modes()
+    # 只渲染部分 mode 时，其余 mode 的旧记录原样保留
+    selected = {manifest.mode_key(m) for m in modes}
+    kept = {k: v for k, v in previous.items() if k.split("/")[0] not in selected}
+    tasks = []
+    for mode in modes:
+        entry = data_manifest["files"].get(manifest.mode_key(mode))
+        years = manifest.years_for_mode(data_manifest, mode)
+        if not entry or not years:
+            continue
+        for year in range(years[0], years[1] + 1):
+            key = f"{manifest.mode_key(mode)}/{year}"
+            # 这一帧的数据内容 + 渲染参数都没变才算同一帧（ingest.py 追加一个月只重画受影响的年份）
+            version = f"{manifest.year_version(data_manifest, mode, year)}:{cmap_name}:{fmt}:q{int(quantize.ENABLED)}"
+            old = previous.get(key)
+            if old and old["version"] == version and all((Path(out_dir) / old[k]).exists() for k in ("map", "colorbar")):
+                kept[key] = old
+            else:
+                tasks.append((mode, year, data_dir, str(out_dir), fmt, cmap_name, version))
+    return tasks, kept
+
+
+INDEX_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Interactive Map for Global Warming (static)</title>
+<style>
+  body { font-family: system-ui, sans-serif; margin: 1.5rem; background: #fafafa; color: #222; }
+  .controls { display: flex; gap: 1.5rem; align-items: center; flex-wrap: wrap; margin-bottom: 1rem; }
+  #year { width: 28rem; max-width: 90vw; }
+  #map { width: 100%; max-width: 1440px; image-rendering: pixelated; background: #dde3ea; display: block; }
+  #colorbar { max-width: 720px; width: 100%; display: block; margin-top: .5rem; }
+  .note { color: #666; font-size: .85rem; }
+</style>
+</head>
+<body>
+<h2 id="title"></h2>
+<div class="controls">
+  <label>Month
+    <select id="mode"></select>
+  </label>
+  <label>Year <input type="range" id="year" step="1"> <b id="year-label"></b></label>
+</div>
+<img id="map" alt="temperature map">
+<img id="colorbar" alt="colorbar">
+<p class="note">Static snapshot of ERA5 2&nbsp;m temperature (equirectangular, colour range = 2–98th percentile of each frame).
+The interactive version with click-to-plot time series runs at the main site.</p>
+<script>
+const FRAMES = __FRAMES__;
+const byMode = {};
+for (const f of Object.values(FRAMES)) (byMode[f.mode] = byMode[f.mode] || {})[f.year] = f;
+const modes = Object.keys(byMode).sort((a, b) => (a === "Annual") ? -1 : (b === "Annual") ? 1 : a.localeCompare(b));
+const $ = (id) => document.getElementById(id);
+for (const m of modes) {
+  const o = document.createElement("option");
+  o.value = m; o.textContent = m === "Annual" ? "Annual (全年平均)" : "Month " + m;
+  $("mode").appendChild(o);
+}
+function show() {
+  const frames = byMode[$("mode").value];
+  const years = Object.keys(frames).map(Number).sort((a, b) => a - b);
+  $("year").min = years[0]; $("year").max = years[years.length - 1];
+  let y = Number($("year").value);
+  if (!(y in frames)) { y = years[0]; $("year").value = y; }
+  const f = frames[y];
+  $("map").src = f.map;
+  $("colorbar").src = f.colorbar;
+  $("year-label").textContent = y;
+  $("title").textContent = y + " — " + (f.mode === "Annual" ? "Annual Mean Temperature" : "Month " + f.mode + " Mean Temperature");
+  // 预取相邻年份，拖动滑块时不闪
+  for (const d of [-1, 1]) if (frames[y + d]) new Image().src = frames[y + d].map;
+}
+$("mode").addEventListener("change", show);
+$("year").addEventListener("input", show);
+$("year").value = 0;
+show();
+</script>
+</body>
+</html>
+"""
+
+
+def write_html(frames, out_dir):
+    # 帧列表直接内嵌：index.html 用 file:// 打开也能用
+    html = INDEX_HTML.replace("__FRAMES__", json.dumps(frames, ensure_ascii=False, separators=(",", ":")))
+    path = Path(out_dir) / "index.html"
+    tmp = path.with_suffix(f".html.{os.getpid()}.tmp")
+    tmp.write_text(html, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def render_all(out_dir=STATIC_DIR, data_dir=DATA_DIR, workers=None, fmt="webp", cmap_name="turbo", modes=None, log=print):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    data_manifest = manifest.load_or_rebuild(data_dir)
+    tasks, frames = plan(data_manifest, out_dir, fmt, cmap_name, modes)
+    log(f"{len(tasks)} frames to render, {len(frames)} up to date")
+
+    t0 = time.perf_counter()
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        # 每个进程连续拿同一个 mode 的一段年份：文件句柄和色标对象都能复用
+        chunksize = max(1, min(32, len(tasks) // (workers * 4) or 1))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for k, rec in enumerate(pool.map(render_frame, tasks, chunksize=chunksize), 1):
+                frames[f"{rec['mode']}/{rec['year']}"] = rec
+                if k % 50 == 0 or k == len(tasks):
+                    elapsed = time.perf_counter() - t0
+                    log(f"  {k}/{len(tasks)} frames, {k / elapsed:.1f} frames/s")
+                    # 中途被打断时已完成的帧也不用重画
+                    write_index({"frames": frames}, out_dir)
+    elapsed = time.perf_counter() - t0
+
+    write_index({"frames": frames}, out_dir)
+    write_html(frames, out_dir)
+    fps = len(tasks) / elapsed if tasks and elapsed > 0 else 0.0
+    log(f"rendered {len(tasks)} frames in {elapsed:.1f} s ({fps:.1f} frames/s); site: {out_dir / 'index.html'}")
+    return len(tasks), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render every (mode, year) map into a static site")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--out", default=str(STATIC_DIR))
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--format", choices=("webp", "png"), default="webp")
+    parser.add_argument("--cmap", default="turbo")
+    parser.add_argument("--mode", action="append", help="only these modes (Annual or 1-12); repeatable")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt == "webp":
+        from PIL import features
+
+        if not features.check("webp"):
+            print("Pillow was built without WebP support; writing PNG instead", file=sys.stderr)
+            fmt = "png"
+    modes = [("Annual" if m.lower() == "annual" else int(m)) for m in args.mode] if args.mode else None
+    render_all(args.out, args.data_dir, args.workers, fmt, args.cmap, modes)
+
+
+if __name__ == "__main__":
+    main()
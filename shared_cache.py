@@ -0,0 +1,270 @@
+"""
+跨进程共享的解码结果缓存。
+
+st.cache_data 是每个进程各一份（而且存的是 pickle，每次命中还要反序列化复制一份），
+多个 worker 时每个进程都要各自解码、各自占内存。这里把解码后的数组写成 .npy 文件，
+放在本机共享目录（默认 /dev/shm，即内存盘），所有进程用 np.load(mmap_mode="r")
+只读映射同一份数据：一台机器只解码一次，内存也不随 worker 数翻倍。
+
+- key 里带上源文件的 mtime/size，数据文件被替换后自然换成新 key
+- 同一个 key 同时未命中时用文件锁串行化，只有一个进程去解码，其他进程等它写完直接读；
+  锁文件固定 LOCK_STRIPES 个（按 key 的摘要分配），不会随 key 的数量在内存盘上越积越多
+- 写入先写临时目录再 rename，读者永远看不到写了一半的条目；DONE 里记着数组名，
+  缺任何一个（比如正好被淘汰）都算未命中，不会返回残缺的 dict
+- 目录总大小超过上限时按最久未写入淘汰到上限的 90%（已被映射的文件删掉后仍可继续读）；
+  不是每次写入都扫描目录：进程内累计估计大小，超过上限或每 PRUNE_SECONDS 秒才重新扫描
+- 写不进去（比如容器里 /dev/shm 只有 64 MB，ENOSPC）时只记日志，直接返回算好的数组，页面照常工作
+
+环境变量：GW_SHARED_CACHE_DIR（设为 off 关闭）、GW_SHARED_CACHE_MAX_MB
+（默认 2048，且不超过所在文件系统的一半）。
+
+注意：上限只约束目录里的文件。被淘汰的条目如果还被某个进程映射着（Map_Interactive 里的
+st.cache_resource 最多各保留 max_entries 个），它的页面要等映射释放才归还，/dev/shm 的实际占用
+最多再多出“每个 worker × 这些被映射条目的大小”。要严格控制内存盘用量，请把上限再留出这部分余量。
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，退化成“可能重复解码”，结果仍然正确
+    fcntl = None
+
+logger = logging.getLogger("gw.shared_cache")
+
+# 两次全量扫描（prune）之间至少隔多久；期间按进程内估计的大小判断是否超限
+PRUNE_SECONDS = 30.0
+# 跨进程锁文件的个数：不同 key 偶尔共用一个锁，只是多等一会儿
+LOCK_STRIPES = 64
+LOCK_DIR = ".locks"
+
+
+def _default_root():
+    env = os.environ.get("GW_SHARED_CACHE_DIR")
+    if env is not None:
+        return None if env.lower() in ("", "0", "off", "none") else Path(env)
+    shm = Path("/dev/shm")
+    base = shm if shm.is_dir() and os.access(shm, os.W_OK) else Path(tempfile.gettempdir())
+    return base / "gw_era5_cache"
+
+
+def source_token(path):
+    """源文件版本：名字 + mtime + 大小。"""
+    st_ = os.stat(path)
+    return f"{Path(path).name}:{st_.st_mtime_ns}:{st_.st_size}"
+
+
+class SharedArrayStore:
+    """key(str) -> {name: ndarray}，数组以只读 memmap 返回。"""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = Path(root) if root else None
+        if self.root:
+            self.root.mkdir(parents=True, exist_ok=True)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("GW_SHARED_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+            if self.root and "GW_SHARED_CACHE_MAX_MB" not in os.environ:
+                # Docker 默认的 /dev/shm 只有 64 MB：默认上限不超过所在文件系统的一半
+                max_bytes = min(max_bytes, shutil.disk_usage(self.root).total // 2)
+        self.max_bytes = max_bytes
+        # key -> [线程锁, 使用中的线程数]；没人用时删掉，字典大小只和并发未命中数有关
+        self._thread_locks = {}
+        self._thread_locks_guard = threading.Lock()
+        self._size_lock = threading.Lock()
+        self._estimated_bytes = None
+        self._scanned = 0.0
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def _entry_dir(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / digest
+
+    def get(self, key):
+        """命中返回 {name: 只读 memmap}；未命中返回 None。"""
+        if not self.enabled:
+            return None
+        entry = self._entry_dir(key)
+        try:
+            names = (entry / "DONE").read_text(encoding="utf-8").split()
+            if not names:
+                # 旧格式的空 DONE：按目录里的文件来
+                names = [p.stem for p in entry.glob("*.npy")]
+            arrays = {name: np.load(entry / f"{name}.npy", mmap_mode="r") for name in names}
+        except (OSError, ValueError):
+            # 不存在，或读的时候恰好被淘汰了：当作未命中
+            return None
+        return arrays or None
+
+    def put(self, key, arrays):
+        """写入一个条目（原子）；返回读回来的 memmap 版本。写入失败（磁盘满等）时原样返回 arrays。"""
+        if not self.enabled:
+            return arrays
+        entry = self._entry_dir(key)
+        tmp = None
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=entry.parent))
+            for name, arr in arrays.items():
+                np.save(tmp / f"{name}.npy", np.asarray(arr), allow_pickle=False)
+            (tmp / "KEY").write_text(key, encoding="utf-8")
+            (tmp / "DONE").write_text("\n".join(arrays), encoding="utf-8")
+            written = sum(p.stat().st_size for p in tmp.iterdir())
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # 别的进程已经写好了同一个 key
+                shutil.rmtree(tmp, ignore_errors=True)
+                written = 0
+        except OSError as exc:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+            logger.warning("shared cache write failed for %s (%s); serving uncached", key, exc)
+            # 多半是空间不够：下一次写入前重新扫描、按上限淘汰
+            with self._size_lock:
+                self._estimated_bytes = None
+            return arrays
+        except BaseException:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._note_written(written)
+        return self.get(key) or arrays
+
+    @contextmanager
+    def _key_lock(self, key):
+        # 进程内：线程锁；进程间：flock
+        with self._thread_locks_guard:
+            slot = self._thread_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                f = None
+                if fcntl is not None:
+                    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+                    lock_path = self.root / LOCK_DIR / f"{int(digest[:8], 16) % LOCK_STRIPES:02d}.lock"
+                    try:
+                        lock_path.parent.mkdir(parents=True, exist_ok=True)
+                        f = open(lock_path, "a+b")
+                    except OSError as exc:
+                        # 建不了锁文件：退化成“可能重复解码”，结果仍然正确
+                        logger.warning("shared cache lock unavailable for %s (%s)", key, exc)
+                if f is None:
+                    yield
+                    return
+                with f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        finally:
+            with self._thread_locks_guard:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._thread_locks[key]
+
+    def get_or_compute(self, key, compute):
+        """
+        compute() -> {name: ndarray}
+        本机所有进程对同一个 key 只算一次。
+        """
+        if not self.enabled:
+            return compute()
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+        with self._key_lock(key):
+            hit = self.get(key)
+            if hit is not None:
+                return hit
+            return self.put(key, compute())
+
+    def entries(self):
+        if not self.enabled or not self.root.exists():
+            return []
+        # .tmp-* / .trash-* 是正在写入 / 正在删除的目录，不算条目
+        return [d for d in self.root.glob("??/*") if not d.name.startswith(".") and d.is_dir() and (d / "DONE").exists()]
+
+    def stats(self):
+        """(条目数, 总字节)。"""
+        entries = self.entries()
+        total = 0
+        for d in entries:
+            for p in d.iterdir():
+                try:
+                    total += p.stat().st_size
+                except OSError:
+                    pass
+        return len(entries), total
+
+    def _note_written(self, nbytes):
+        """写入后调用：估计的总大小超过上限、或距上次扫描超过 PRUNE_SECONDS 秒时才 prune。"""
+        with self._size_lock:
+            now = time.monotonic()
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += nbytes
+            due = (
+                self._estimated_bytes is None
+                or self._estimated_bytes > self.max_bytes
+                or now - self._scanned >= PRUNE_SECONDS
+            )
+        if due:
+            self.prune()
+
+    def prune(self):
+        """超过上限时删掉最久以前写入的条目（删到上限的 90%）。"""
+        if not self.enabled or self.max_bytes <= 0:
+            return
+        sized = []
+        total = 0
+        for d in self.entries():
+            try:
+                size = sum(p.stat().st_size for p in d.iterdir())
+                sized.append(((d / "DONE").stat().st_mtime, size, d))
+            except OSError:
+                continue
+            total += size
+        # 旧版本按 key 建的锁文件（<摘要>.lock）：已经不用了，顺手清掉
+        for stale in self.root.glob("??/*.lock"):
+            stale.unlink(missing_ok=True)
+        if total > self.max_bytes:
+            # 删到上限的 90%：缓存满了以后也不会每写一个条目就扫描一次
+            target = self.max_bytes * 0.9
+            for _, size, d in sorted(sized):
+                self._remove(d)
+                total -= size
+                if total <= target:
+                    break
+        with self._size_lock:
+            self._estimated_bytes = total
+            self._scanned = time.monotonic()
+
+    @staticmethod
+    def _remove(entry):
+        # 先原子地改名移走，再慢慢删：读者要么看到完整条目，要么看不到
+        trash = entry.with_name(f".trash-{entry.name}-{os.getpid()}-{threading.get_ident()}")
+        try:
+            os.rename(entry, trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def clear(self):
+        if self.enabled and self.root.exists():
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root.mkdir(parents=True, exist_ok=True)
+
+
+STORE = SharedArrayStore(_default_root())
@@ -0,0 +1,385 @@
+"""
+本地 XYZ 瓦片服务：按 (mode, year, cmap, z, x, y) 返回该瓦片范围内格子的 GeoJSON。
+
+    python tile_server.py [--port 8765]
+
+然后启动页面时设置 GW_TILE_URL=http://localhost:8765，控制面板里会出现 “Tiled layer” 开关：
+地图改用 deck.gl TileLayer，只请求屏幕上可见的瓦片。
+
+- 数据与 load_year_field 相同（era5_data.read_year_field，按缩放级别自动选金字塔层）
+- 色标范围按整帧计算，相邻瓦片颜色一致
+- 缓存：进程内 LRU（按字节上限）+ 磁盘缓存（GW_TILE_CACHE_MAX_MB，默认 512）；ETag 由 manifest 里这一帧的数据版本决定，
+  浏览器带 If-None-Match 时直接返回 304，不用生成瓦片
+
+同一个服务也提供批量导出（见 export.py），响应边生成边发送，不在内存里攒完整文件：
+    /export/field?mode=7&year=2000&format=csv
+    /export/point?lat=40&lon=116
+    /export/cube?mode=Annual&south=20&north=55&west=70&east=140&start=1990&end=2020&format=netcdf
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import era5_data
+import export
+import manifest
+import quantize
+from era5_data import DATA_DIR, file_for_mode
+
+logger = logging.getLogger("gw.tiles")
+
+TILE_CACHE_DIR = Path(os.environ.get("GW_TILE_CACHE_DIR", DATA_DIR / "tile_cache"))
+TILE_CACHE_MAX_MB = float(os.environ.get("GW_TILE_CACHE_MAX_MB", "512"))
+# 磁盘缓存两次全量扫描之间至少隔多久；期间按进程内估计的大小判断是否超限
+DISK_PRUNE_SECONDS = 60.0
+CMAPS = ("turbo", "viridis", "plasma", "inferno")
+
+# 每块瓦片最多画多少个格子（256px 的瓦片，约 4px 一格）
+MAX_CELLS_PER_TILE = 4096
+# 瓦片内容的生成规则有变化时加一：ETag 跟着变，浏览器和磁盘缓存里的旧瓦片不再被使用
+TILE_FORMAT = 2
+MANIFEST_CHECK_SECONDS = 1.0
+
+EXPORT_RE = re.compile(r"^/export/(?P<kind>field|point|cube)$")
+TILE_RE = re.compile(r"^/tiles/(?P<mode>Annual|\d{1,2})/(?P<year>\d{4})/(?P<cmap>\w+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.json$")
+
+
+def tile_bounds(z, x, y):
+    """XYZ 瓦片 -> (south, north, west, span_lon)，与 era5_data.view_bounds 格式相同。"""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, north, west, 360.0 / n
+
+
+def pyramid_levels():
+    # 按 levels.json 的 mtime 缓存：服务运行中执行 build-pyramid 也会生效
+    return _pyramid_levels(era5_data.pyramid_stamp(DATA_DIR))
+
+
+@lru_cache(maxsize=1)
+def _pyramid_levels(stamp):
+    levels = era5_data.read_pyramid_levels(DATA_DIR)
+    if levels == [(0, None)]:
+        levels = [(0, era5_data.read_grid_info(file_for_mode(1))["res_deg"])]
+    return levels
+
+
+@lru_cache(maxsize=64)
+def frame(mode, year, level, version):
+    """一帧数据和整帧色标范围；version 变化（这一年的数据被改过）时自然换 key。"""
+    # era5_data.POOL 负责复用句柄、串行化多线程读取
+    lat, lon, temp_c = era5_data.read_year_field(file_for_mode(mode, level), year)
+    vmin, vmax = era5_data.color_limits(temp_c)
+    return lat, lon, temp_c, vmin, vmax
+
+
+_manifest_lock = threading.Lock()
+_manifest = {"data": None, "checked": 0.0}
+
+
+def data_manifest():
+    """manifest.json（最多每 MANIFEST_CHECK_SECONDS 秒 stat 一次，数据文件变化时自动重建）。"""
+    with _manifest_lock:
+        now = time.monotonic()
+        if _manifest["data"] is None or now - _manifest["checked"] >= MANIFEST_CHECK_SECONDS:
+            _manifest["data"] = manifest.load_or_rebuild(DATA_DIR)
+            _manifest["checked"] = now
+        return _manifest["data"]
+
+
+def source_version(mode, year, level):
+    """这一帧的数据版本：ingest.py 追加 / 修订某一年时，只有这一年的瓦片换 ETag。"""
+    version = manifest.frame_version(data_manifest(), mode, year, level)
+    if version is None:
+        raise FileNotFoundError(file_for_mode(mode, level))
+    return version
+
+
+def tile_etag(mode, year, cmap, z, x, y):
+    level = era5_data.choose_level(
+        pyramid_levels(), tile_bounds(z, x, y), max_cells=MAX_CELLS_PER_TILE, zoom=z, mode=mode, data_dir=DATA_DIR
+    )
+    version = source_version(mode, year, level)
+    key = f"{mode}/{year}/{cmap}/{z}/{x}/{y}@{level}:{version}:r{TILE_FORMAT}"
+    return level, version, '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def render_tile(mode, year, cmap, z, x, y, level, version):
+    """瓦片 GeoJSON（bytes）。"""
+    lat, lon, temp_c, vmin, vmax = frame(mode, year, level, version)
+    bounds = tile_bounds(z, x, y)
+    south, north, west, span = bounds
+
+    # 先按视图裁剪（多留一格），再只保留与瓦片相交的格子
+    lat_c, lon_c, t_c = era5_data.crop_to_view(lat, lon, temp_c, bounds)
+    features = []
+    if t_c.size:
+        lat_e = era5_data.edges_from_centers(lat_c) if len(lat_c) > 1 else np.array([lat_c[0] - 0.5, lat_c[0] + 0.5])
+        lon_e = era5_data.edges_from_centers(lon_c) if len(lon_c) > 1 else np.array([lon_c[0] - 0.5, lon_c[0] + 0.5])
+        rgb = era5_data.colorize(t_c, vmin, vmax, cmap)
+        for i in range(len(lat_c)):
+            la0, la1 = sorted((float(lat_e[i]), float(lat_e[i + 1])))
+            if la1 <= south or la0 >= north:
+                continue
+            for j in range(len(lon_c)):
+                val = float(t_c[i, j])
+                if not np.isfinite(val):
+                    continue
+                lo0, lo1 = float(lon_e[j]), float(lon_e[j + 1])
+                if lo1 <= west or lo0 >= west + span:
+                    continue
+                # 只接触瓦片边线的格子不画；跨边线的格子裁到瓦片范围内，相邻瓦片不会重叠（半透明时接缝处不发暗）
+                lo0, lo1 = max(lo0, west), min(lo1, west + span)
+                a0, a1 = max(la0, south), min(la1, north)
+                ring = [[lo0, a0], [lo1, a0], [lo1, a1], [lo0, a1], [lo0, a0]]
+                features.append(
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Polygon", "coordinates": [[[quantize.round_coord(a), quantize.round_coord(b)] for a, b in ring]]},
+                        "properties": {"temp_c": quantize.round_value(val), "fill_color": [*map(int, rgb[i, j]), 190]},
+                    }
+                )
+    return json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode("utf-8")
+
+
+class TileCache:
+    """
+    进程内 LRU（按字节上限）+ 磁盘目录；key 用 ETag（已包含数据版本）。
+    磁盘上也有上限：超过 disk_max_bytes 时按最久未访问（mtime，命中时会 touch）删到上限的 90%。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=TILE_CACHE_DIR, disk_max_bytes=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if disk_max_bytes is None:
+            disk_max_bytes = int(TILE_CACHE_MAX_MB * 1024 * 1024)
+        self.disk_max_bytes = disk_max_bytes
+        self._mem = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        # 磁盘总大小的估计值；None 表示下次写入时重新扫描
+        self._disk_bytes = None
+        self._disk_scanned = 0.0
+
+    def _disk_path(self, etag):
+        tag = etag.strip('"')
+        return self.disk_dir / tag[:2] / f"{tag}.json"
+
+    def get(self, etag):
+        with self._lock:
+            body = self._mem.get(etag)
+            if body is not None:
+                self._mem.move_to_end(etag)
+                return body
+        if self.disk_dir:
+            path = self._disk_path(etag)
+            try:
+                body = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                # 不存在，或刚被 prune 删掉
+                return None
+            self._put_mem(etag, body)
+            return body
+        return None
+
+    def put(self, etag, body):
+        self._put_mem(etag, body)
+        if self.disk_dir:
+            path = self._disk_path(etag)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp.write_bytes(body)
+                os.replace(tmp, path)
+            except OSError as exc:
+                tmp.unlink(missing_ok=True)
+                logger.warning("tile disk cache write failed (%s); serving uncached", exc)
+                self._disk_bytes = None
+                return
+            self._note_disk(len(body))
+
+    def _note_disk(self, nbytes):
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += nbytes
+            due = (
+                self._disk_bytes is None
+                or self._disk_bytes > self.disk_max_bytes
+                or time.monotonic() - self._disk_scanned >= DISK_PRUNE_SECONDS
+            )
+        # 已经有线程在扫描时不用排队
+        if due and self._prune_lock.acquire(blocking=False):
+            try:
+                self.prune_disk()
+            finally:
+                self._prune_lock.release()
+
+    def prune_disk(self):
+        """磁盘缓存超过上限时删掉最久未访问的瓦片，直到上限的 90%；返回删掉的文件数。"""
+        if not self.disk_dir or self.disk_max_bytes <= 0 or not self.disk_dir.exists():
+            return 0
+        files, total = [], 0
+        for path in self.disk_dir.glob("??/*.json"):
+            try:
+                st_ = path.stat()
+            except OSError:
+                continue
+            files.append((st_.st_mtime, st_.st_size, path))
+            total += st_.st_size
+        removed = 0
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * 0.9
+            for _, size, path in sorted(files):
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+                if total <= target:
+                    break
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_scanned = time.monotonic()
+        return removed
+
+    def _put_mem(self, etag, body):
+        with self._lock:
+            if etag in self._mem:
+                return
+            self._mem[etag] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and self._mem:
+                _, old = self._mem.popitem(last=False)
+                self._bytes -= len(old)
+
+    def stats(self):
+        with self._lock:
+            return len(self._mem), self._bytes
+
+
+CACHE = TileCache()
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    def _send(self, code, body=b"", headers=None):
+        self.send_response(code)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _stream(self, content_type, file_name, chunks):
+        # 不知道总长度：不带 Content-Length，发完关闭连接
+        self.send_response(200)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Disposition", f'attachment; filename="{file_name}"')
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        if self.command == "HEAD":
+            chunks.close()
+            return
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("export cancelled by client: %s", file_name)
+        finally:
+            chunks.close()
+
+    def _export(self, kind, query):
+        q = {k: v[-1] for k, v in parse_qs(query).items()}
+        fmt = q.get("format", "csv")
+        try:
+            if kind == "field":
+                args = export.export_field(export.parse_mode(q["mode"]), int(q["year"]), fmt)
+            elif kind == "point":
+                args = export.export_point(float(q["lat"]), float(q["lon"]), fmt)
+            else:
+                bbox = (float(q.get("south", -90)), float(q.get("north", 90)), float(q.get("west", -180)), float(q.get("east", 180)))
+                args = export.export_cube(export.parse_mode(q["mode"]), bbox, int(q["start"]), int(q["end"]), fmt)
+        except FileNotFoundError:
+            self._send(404, b"no data")
+            return
+        except (KeyError, ValueError, RuntimeError) as exc:
+            self._send(400, f"bad export request: {exc}".encode("utf-8"))
+            return
+        self._stream(*args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        m = EXPORT_RE.match(url.path)
+        if m:
+            self._export(m["kind"], url.query)
+            return
+        m = TILE_RE.match(url.path)
+        if not m:
+            self._send(404, b"not found")
+            return
+        mode = "Annual" if m["mode"] == "Annual" else int(m["mode"])
+        year, cmap = int(m["year"]), m["cmap"]
+        z, x, y = int(m["z"]), int(m["x"]), int(m["y"])
+        if cmap not in CMAPS or (mode != "Annual" and not 1 <= mode <= 12) or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            self._send(400, b"bad tile")
+            return
+
+        try:
+            level, version, etag = tile_etag(mode, year, cmap, z, x, y)
+        except FileNotFoundError:
+            self._send(404, b"no data")
+            return
+
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+        if etag in (t.strip() for t in self.headers.get("If-None-Match", "").split(",")):
+            self._send(304, headers=headers)
+            return
+
+        body = CACHE.get(etag)
+        if body is None:
+            try:
+                body = render_tile(mode, year, cmap, z, x, y, level, version)
+            except ValueError as exc:
+                self._send(404, str(exc).encode("utf-8"))
+                return
+            CACHE.put(etag, body)
+        self._send(200, body, {**headers, "Content-Type": "application/json"})
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local XYZ tile and export server for the temperature layer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = ThreadingHTTPServer((args.host, args.port), TileHandler)
+    logger.info("serving tiles on http://%s:%d/tiles/{mode}/{year}/{cmap}/{z}/{x}/{y}.json", args.host, args.port)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()